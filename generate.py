@@ -1,22 +1,489 @@
 # Faiyaz Hasan 
-import sys
+import argparse
 
 from crossword import *
+import fnmatch
+import functools
+import gzip
+import hashlib
+import heapq
 import itertools
-import copy
+import json
+import multiprocessing
+import os
+import platform
+import random
+import tempfile
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import (
+    FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+)
+
+
+def bitmask(indices, size):
+    """
+    Return an integer with bit k set for every k in `indices`,
+    where every k is less than `size`.
+    """
+    # setting the bits in a byte buffer is linear, unlike or-ing big ints
+    bits = bytearray((size + 7) // 8)
+    for k in indices:
+        bits[k >> 3] |= 1 << (k & 7)
+    return int.from_bytes(bits, "little")
+
+
+class WordIndex():
+    """
+    Bitset index over every word of a single length.
+    Word k of `self.words` is bit k of a mask, and `self.letters[pos][letter]`
+    is the mask of the words that have `letter` at position `pos`.
+    """
+
+    def __init__(self, length, words):
+        self.length = length
+        self.words = sorted(words)
+        self.positions = {word: k for k, word in enumerate(self.words)}
+        self.full = (1 << len(self.words)) - 1
+
+        # collecting the word numbers for every (position, letter) pair
+        by_letter = [dict() for _ in range(length)]
+        for k, word in enumerate(self.words):
+            for pos, letter in enumerate(word):
+                by_letter[pos].setdefault(letter, []).append(k)
+
+        # turning each list of word numbers into a mask
+        self.letters = [
+            {letter: bitmask(ks, len(self.words)) for letter, ks in column.items()}
+            for column in by_letter
+        ]
+
+    def words_in(self, mask):
+        """
+        Yield the words whose bits are set in `mask`, in order.
+        """
+        # scanning the binary string is linear in the size of the bucket,
+        # where peeling off the lowest bit of a big int is quadratic
+        bits = bin(mask)[:1:-1]
+        k = bits.find("1")
+        while k != -1:
+            yield self.words[k]
+            k = bits.find("1", k + 1)
+
+
+def build_indexes(words):
+    """
+    Bucket `words` by length and return a dict mapping
+    each length to the WordIndex of that bucket.
+    """
+    buckets = dict()
+    for word in words:
+        buckets.setdefault(len(word), []).append(word)
+    return {
+        length: WordIndex(length, bucket)
+        for length, bucket in buckets.items()
+    }
+
+
+# the most words a domain change can add or remove while its cached letter
+# histograms are updated word by word instead of being recounted
+HISTOGRAM_UPDATE_LIMIT = 32
+
+
+class Domain():
+    """
+    Domain of a crossword variable, stored as a bitmask over a WordIndex.
+    Behaves like the set of words it holds (len, iteration, membership,
+    remove, copy), while the solver works on `mask` directly.
+    The domain size is kept up to date every time the mask changes, and
+    so are the letter histograms asked for so far, unless many words
+    changed at once (then they are counted again when next asked for).
+    """
+
+    def __init__(self, index, mask=None):
+        self.index = index
+        self._mask = index.full if mask is None else mask
+        self._size = self._mask.bit_count()
+
+        # position -> {letter: number of words with that letter there}
+        self._histograms = {}
+
+    @property
+    def mask(self):
+        return self._mask
+
+    @mask.setter
+    def mask(self, mask):
+        removed = self._mask & ~mask
+        added = mask & ~self._mask
+        self._mask = mask
+        removed_count = removed.bit_count()
+        added_count = added.bit_count()
+        self._size += added_count - removed_count
+        if not self._histograms:
+            return
+
+        # shifting the cached histograms by the few words that left or came
+        # back; after bigger changes they are recounted when next asked for
+        if removed_count + added_count > HISTOGRAM_UPDATE_LIMIT:
+            self._histograms = {}
+            return
+        histograms = self._histograms.items()
+        for changed, step in ((removed, -1), (added, 1)):
+            for word in self.index.words_in(changed):
+                for pos, histogram in histograms:
+                    histogram[word[pos]] += step
+
+    def histogram(self, pos):
+        """
+        Return a dict mapping each letter to the number of words in the
+        domain with that letter at `pos`.
+        """
+        if pos not in self._histograms:
+            self._histograms[pos] = {
+                letter: (self._mask & letter_mask).bit_count()
+                for letter, letter_mask in self.index.letters[pos].items()
+            }
+        return self._histograms[pos]
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return self.index.words_in(self.mask)
+
+    def __contains__(self, word):
+        k = self.index.positions.get(word)
+        return k is not None and (self.mask >> k) & 1 == 1
+
+    def __eq__(self, other):
+        return set(self) == set(other)
+
+    def __repr__(self):
+        return f"Domain({set(self)})"
+
+    def remove(self, word):
+        if word not in self:
+            raise KeyError(word)
+        self.mask &= ~(1 << self.index.positions[word])
+
+    def copy(self):
+        return Domain(self.index, self.mask)
+
+    def with_letter(self, pos, letter):
+        """
+        Return the mask of words in the domain with `letter` at `pos`.
+        """
+        return self.mask & self.index.letters[pos].get(letter, 0)
+
+
+def variable_key(var):
+    """
+    Return a string naming crossword variable `var`, for use in files.
+    """
+    return f"{var.i},{var.j},{var.direction},{var.length}"
+
+
+class SolutionCache():
+    """
+    On-disk cache of solved crosswords. Each structure has one gzipped
+    JSON file holding the hash of the word list it was solved with, the
+    solution, and the domains left after arc consistency. Once the files
+    take up more than `max_bytes`, the least recently used ones are
+    deleted.
+    """
+
+    def __init__(self, directory, max_bytes=64 * 2**20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.json.gz")
+
+    def load(self, key):
+        """
+        Return the entry stored under `key`, or None if there is none.
+        """
+        path = self.path(key)
+        try:
+            with gzip.open(path, "rt") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        # a hit makes the file the most recently used one
+        os.utime(path)
+        return entry
+
+    def store(self, key, entry):
+        """
+        Save `entry` under `key`, then evict files if the cache is too big.
+        """
+        # writing to a temporary file first, so that concurrent workers
+        # never read a half written entry
+        fd, temp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with gzip.open(os.fdopen(fd, "wb"), "wt") as f:
+            json.dump(entry, f)
+        os.replace(temp, self.path(key))
+        self.evict()
+
+    def evict(self):
+        """
+        Delete the least recently used files until the cache fits.
+        """
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json.gz"):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+CELL_SIZE = 100
+CELL_BORDER = 2
+FONT = "assets/fonts/OpenSans-Regular.ttf"
+
+
+@functools.lru_cache(maxsize=None)
+def load_font(path, size):
+    """
+    Load a TrueType font once per process.
+    """
+    from PIL import ImageFont
+    return ImageFont.truetype(path, size)
+
+
+@functools.lru_cache(maxsize=None)
+def cell_tile(letter):
+    """
+    Return the pixels of a white cell showing `letter` (or nothing, if
+    `letter` is None) as an RGBA NumPy array, rendered once per letter.
+    """
+    import numpy as np
+    from PIL import Image, ImageDraw
+
+    # the cell rectangle used to be drawn with both corners included
+    interior_size = CELL_SIZE - 2 * CELL_BORDER
+    tile = Image.new("RGBA", (interior_size + 1, interior_size + 1), "white")
+    if letter:
+        font = load_font(FONT, 80)
+        draw = ImageDraw.Draw(tile)
+
+        # the right and bottom of the bounding box from the origin are
+        # what the removed ImageDraw.textsize used to return
+        _, _, w, h = draw.textbbox((0, 0), letter, font=font)
+        draw.text(
+            ((interior_size - w) / 2, (interior_size - h) / 2 - 10),
+            letter, fill="black", font=font
+        )
+    return np.asarray(tile)
+
+
+def render_png(structure, letters, filename):
+    """
+    Save a crossword image to `filename`, where `structure` tells which
+    cells are open and `letters` is the letter grid of the assignment.
+    Cells are pasted from pre-rendered tiles into a NumPy canvas.
+    """
+    import numpy as np
+    from PIL import Image
+
+    height = len(structure)
+    width = len(structure[0]) if structure else 0
+
+    # Create a blank canvas
+    canvas = np.zeros((height * CELL_SIZE, width * CELL_SIZE, 4), np.uint8)
+    canvas[:, :, 3] = 255
+    for i in range(height):
+        for j in range(width):
+            if structure[i][j]:
+                tile = cell_tile(letters[i][j])
+                top = i * CELL_SIZE + CELL_BORDER
+                left = j * CELL_SIZE + CELL_BORDER
+                canvas[top:top + tile.shape[0], left:left + tile.shape[1]] = tile
+
+    Image.fromarray(canvas, "RGBA").save(filename)
+
+
+def _render_job(job):
+    return render_png(*job)
+
+
+def save_many(creators, assignments, filenames, workers=None):
+    """
+    Save many crossword assignments at once, rendering them in a pool
+    of `workers` processes. `creators`, `assignments` and `filenames`
+    are parallel lists.
+    """
+    # only the grids are sent to the workers, not the creators' domains
+    jobs = [
+        (creator.crossword.structure, creator.letter_grid(assignment), filename)
+        for creator, assignment, filename
+        in zip(creators, assignments, filenames)
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(_render_job, jobs))
+
+
+def new_stats():
+    """
+    Return zeroed solver statistics: search counters, and the seconds
+    spent in each phase of `CrosswordCreator.solve`.
+    """
+    return {
+        "nodes": 0,
+        "backtracks": 0,
+        "max_depth": 0,
+        "revisions": 0,
+        "wipeouts": 0,
+        "backjumps": 0,
+        "nogoods": 0,
+        "nogood_prunes": 0,
+        "seconds": {
+            "node_consistency": 0.0,
+            "ac3": 0.0,
+            "search": 0.0,
+            "select_variable": 0.0,
+            "order_domain_values": 0.0,
+            "consistent": 0.0,
+            "propagation": 0.0
+        }
+    }
+
+
+class SearchAborted(Exception):
+    """
+    Raised inside a search that ran out of time or was cancelled.
+    """
+
 
 class CrosswordCreator():
 
-    def __init__(self, crossword):
+    def __init__(self, crossword, indexes=None):
         """
         Create new CSP crossword generate.
+        `indexes` are prebuilt word indexes (see `build_indexes`) that are
+        used instead of the crossword's own words, and are never modified.
         """
         self.crossword = crossword
+
+        # bucketing the words by length and indexing every bucket by letter
+        if indexes is None:
+            indexes = build_indexes(self.crossword.words)
+        self.indexes = dict(indexes)
         self.domains = {
-            var: self.crossword.words.copy()
+            var: Domain(self.index_for(var.length))
             for var in self.crossword.variables
         }
 
+        # Crossword.neighbors scans every variable, so it is only asked once
+        self.neighbors = {
+            var: self.crossword.neighbors(var)
+            for var in self.crossword.variables
+        }
+
+        # counters and timers of the last solve (see `new_stats`); the
+        # checks of single candidate values are only timed when profiling
+        self.stats = new_stats()
+        self.profile = False
+
+        # (variable, old mask) for every domain change, so a search
+        # can undo its pruning without copying the domains
+        self.trail = []
+
+        # search budget: a time.monotonic() deadline and an event that
+        # another process can set to cancel the search
+        self.deadline = None
+        self.cancel = None
+        self.timed_out = False
+
+        # random tie breaking for seeded searches
+        self.random = None
+
+        # number of values ordered by `order_domain_values` in a huge
+        # domain, or None to order every value
+        self.lcv_sample = None
+
+        # variable ordering: "mrv" pops (domain size, -degree) entries from
+        # `self.heap`, which gets a fresh entry whenever a domain changes;
+        # "wdeg" divides the domain size by the weights of the constraints
+        # with unassigned neighbors, which grow every time a constraint fails
+        self.heuristic = "mrv"
+        self.heap = None
+        self.heap_entries = itertools.count()
+        self.weights = {}
+
+        # the "cbj" search: the order variables were assigned in, and
+        # failed partial assignments (frozensets of (variable, word) pairs)
+        # from least to most recently used, indexed by their pairs
+        self.depth = {}
+        self.nogood_limit = 10000
+        self.nogoods = OrderedDict()
+        self.nogood_index = {}
+
+    def restrict(self, var, mask):
+        """
+        Replace the mask of `var`'s domain, recording the old one on the trail.
+        """
+        self.trail.append((var, self.domains[var].mask))
+        self.domains[var].mask = mask
+        self.push_variable(var)
+
+    def undo(self, mark):
+        """
+        Restore every domain changed since the trail had `mark` entries.
+        """
+        # only the oldest mask of each variable has to be written back
+        restored = {}
+        while len(self.trail) > mark:
+            var, mask = self.trail.pop()
+            restored[var] = mask
+        for var, mask in restored.items():
+            self.domains[var].mask = mask
+            self.push_variable(var)
+
+    def push_variable(self, var):
+        """
+        Add a heap entry for `var` with the current size of its domain.
+        Older entries of `var` are left behind and skipped when popped.
+        """
+        if self.heap is None:
+            return
+        tie = self.random.random() if self.random is not None else 0
+        heapq.heappush(self.heap, (
+            len(self.domains[var]), -len(self.neighbors[var]),
+            tie, next(self.heap_entries), var
+        ))
+
+    def fail_constraint(self, x, y):
+        """
+        Record that the constraint between `x` and `y` caused a failure,
+        raising its weight for the "wdeg" heuristic.
+        """
+        key = frozenset((x, y))
+        self.weights[key] = self.weights.get(key, 1) + 1
+
+    def index_for(self, length):
+        """
+        Return the WordIndex of the words with the given length.
+        """
+        if length not in self.indexes:
+            self.indexes[length] = WordIndex(length, [])
+        return self.indexes[length]
+
     def letter_grid(self, assignment):
         """
         Return 2D array representing a given assignment.
@@ -33,67 +500,248 @@ class CrosswordCreator():
                 letters[i][j] = word[k]
         return letters
 
-    def print(self, assignment):
+    def text(self, assignment):
         """
-        Print crossword assignment to the terminal.
+        Return crossword assignment as text, one line per row.
         """
         letters = self.letter_grid(assignment)
+        rows = []
         for i in range(self.crossword.height):
+            row = []
             for j in range(self.crossword.width):
                 if self.crossword.structure[i][j]:
-                    print(letters[i][j] or " ", end="")
+                    row.append(letters[i][j] or " ")
                 else:
-                    print("█", end="")
-            print()
+                    row.append("█")
+            rows.append("".join(row))
+        return "\n".join(rows)
+
+    def print(self, assignment):
+        """
+        Print crossword assignment to the terminal.
+        """
+        print(self.text(assignment))
 
     def save(self, assignment, filename):
         """
         Save crossword assignment to an image file.
+        A filename ending in .svg or .txt is written as SVG or plain text,
+        without Pillow.
         """
-        from PIL import Image, ImageDraw, ImageFont
-        cell_size = 100
-        cell_border = 2
-        interior_size = cell_size - 2 * cell_border
-        letters = self.letter_grid(assignment)
-
-        # Create a blank canvas
-        img = Image.new(
-            "RGBA",
-            (self.crossword.width * cell_size,
-             self.crossword.height * cell_size),
-            "black"
-        )
-        font = ImageFont.truetype("assets/fonts/OpenSans-Regular.ttf", 80)
-        draw = ImageDraw.Draw(img)
+        extension = os.path.splitext(filename)[1].lower()
+        if extension == ".txt":
+            with open(filename, "w") as f:
+                f.write(self.text(assignment) + "\n")
+        elif extension == ".svg":
+            with open(filename, "w") as f:
+                f.write(self.svg(assignment))
+        else:
+            render_png(self.crossword.structure,
+                       self.letter_grid(assignment), filename)
 
+    def svg(self, assignment):
+        """
+        Return crossword assignment as an SVG document.
+        """
+        letters = self.letter_grid(assignment)
+        width = self.crossword.width * CELL_SIZE
+        height = self.crossword.height * CELL_SIZE
+        size = CELL_SIZE - 2 * CELL_BORDER
+        parts = [
+            f'<svg xmlns="http://www.w3.org/2000/svg" '
+            f'width="{width}" height="{height}">',
+            f'<rect width="{width}" height="{height}" fill="black"/>'
+        ]
         for i in range(self.crossword.height):
             for j in range(self.crossword.width):
+                if not self.crossword.structure[i][j]:
+                    continue
+                x = j * CELL_SIZE + CELL_BORDER
+                y = i * CELL_SIZE + CELL_BORDER
+                parts.append(
+                    f'<rect x="{x}" y="{y}" width="{size}" height="{size}" '
+                    f'fill="white"/>'
+                )
+                if letters[i][j]:
+                    parts.append(
+                        f'<text x="{x + size / 2}" y="{y + size / 2}" '
+                        f'font-family="Open Sans, sans-serif" font-size="80" '
+                        f'text-anchor="middle" dominant-baseline="central">'
+                        f'{letters[i][j]}</text>'
+                    )
+        parts.append("</svg>")
+        return "\n".join(parts) + "\n"
 
-                rect = [
-                    (j * cell_size + cell_border,
-                     i * cell_size + cell_border),
-                    ((j + 1) * cell_size - cell_border,
-                     (i + 1) * cell_size - cell_border)
-                ]
-                if self.crossword.structure[i][j]:
-                    draw.rectangle(rect, fill="white")
-                    if letters[i][j]:
-                        w, h = draw.textsize(letters[i][j], font=font)
-                        draw.text(
-                            (rect[0][0] + ((interior_size - w) / 2),
-                             rect[0][1] + ((interior_size - h) / 2) - 10),
-                            letters[i][j], fill="black", font=font
-                        )
-
-        img.save(filename)
-
-    def solve(self):
+    def solve(self, strategy="backtrack", seed=None, timeout=None, cancel=None,
+              lcv_sample=None, heuristic="mrv", cache=None, profile=False):
         """
         Enforce node and arc consistency, and then solve the CSP.
+        `strategy` picks the search: "backtrack" for plain backtracking,
+        "mac" for maintaining arc consistency after every assignment,
+        "cbj" for conflict-directed backjumping with nogood learning.
+        With a `seed`, ties between variables and values are broken at
+        random. The search gives up (returning None and setting
+        `self.timed_out`) after `timeout` seconds or once `cancel` is set.
+        With `lcv_sample`, domains larger than that are only partly ordered
+        by least-constraining value (see `order_domain_values`).
+        `heuristic` picks the variable ordering, "mrv" or "wdeg" (see
+        `select_unassigned_variable`).
+        With a SolutionCache `cache`, a cached solution of the same structure
+        is returned if it still fits the word list, and cached domains are
+        searched first if they are all still in the word list (see
+        `warm_start`). New solutions are stored in the cache.
+        Counters and timings of the run are left in `self.stats`. The
+        "consistent" and "propagation" timings are taken for every candidate
+        value, which slows the search down, so they stay at zero unless
+        `profile` is set.
         """
+        if strategy not in ("backtrack", "mac", "cbj"):
+            raise ValueError(f"Unknown search strategy: {strategy}")
+        if heuristic not in ("mrv", "wdeg"):
+            raise ValueError(f"Unknown variable heuristic: {heuristic}")
+        self.random = random.Random(seed) if seed is not None else None
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.cancel = cancel
+        self.timed_out = False
+        self.lcv_sample = lcv_sample
+        self.profile = profile
+        self.heuristic = heuristic
+        self.stats = new_stats()
+
+        start = time.perf_counter()
         self.enforce_node_consistency()
+        self.add_time("node_consistency", start)
+
+        entry = None
+        if cache is not None:
+            entry = cache.load(self.structure_key())
+        if entry is not None:
+            result = self.warm_start(entry, strategy, cache)
+            if result is not None or self.timed_out:
+                return result
+
+        start = time.perf_counter()
         self.ac3()
-        return self.backtrack(dict())
+        self.add_time("ac3", start)
+        domains = {var: domain.mask for var, domain in self.domains.items()}
+        result = self.search(strategy)
+        if result is not None and cache is not None:
+            cache.store(self.structure_key(), self.cache_entry(result, domains))
+        return result
+
+    def search(self, strategy):
+        """
+        Run the search picked by `strategy` from the current domains.
+        Return a complete assignment, or None if there is none or the
+        search ran out of budget (then `self.timed_out` is set).
+        """
+        # the preprocessing never has to be undone
+        self.trail = []
+        # "wdeg" never pops the heap, so it is not kept up at all
+        self.heap = [] if self.heuristic == "mrv" else None
+        for var in self.crossword.variables:
+            self.push_variable(var)
+        start = time.perf_counter()
+        self.depth = {}
+        self.nogoods = OrderedDict()
+        self.nogood_index = {}
+        try:
+            if strategy == "backtrack":
+                return self.backtrack(dict())
+            elif strategy == "cbj":
+                return self.backjump(dict(), set())[0]
+            return self.backtrack_mac(dict())
+        except SearchAborted:
+            self.timed_out = True
+            return None
+        finally:
+            self.add_time("search", start)
+
+    def add_time(self, phase, start):
+        """
+        Add the time since `start` (from time.perf_counter) to `phase`.
+        """
+        self.stats["seconds"][phase] += time.perf_counter() - start
+
+    def structure_key(self):
+        """
+        Return a hash of the crossword structure.
+        """
+        rows = (
+            "".join("_" if cell else "#" for cell in row)
+            for row in self.crossword.structure
+        )
+        return hashlib.sha256("\n".join(rows).encode()).hexdigest()
+
+    def cache_entry(self, assignment, domains):
+        """
+        Return the cache entry for solution `assignment`, where `domains`
+        maps each variable to its domain mask after arc consistency.
+        """
+        return {
+            "solution": {
+                variable_key(var): word for var, word in assignment.items()
+            },
+            "domains": {
+                variable_key(var): list(Domain(self.domains[var].index, mask))
+                for var, mask in domains.items()
+            }
+        }
+
+    def warm_start(self, entry, strategy, cache):
+        """
+        Solve from the cache entry of this structure in SolutionCache `cache`.
+        Return the cached solution if every word of it is still in the
+        word list, which is always the case when words were only added.
+        Otherwise search the cached domains, minus the words that are gone,
+        first: any solution in them is a solution, and it replaces the stale
+        one in the cache. Return None when neither works, leaving the
+        domains node-consistent.
+        """
+        variables = {variable_key(var): var for var in self.crossword.variables}
+        if entry["solution"].keys() != variables.keys():
+            return None
+
+        # re-validating the solution against the current word list
+        solution = {
+            variables[key]: word for key, word in entry["solution"].items()
+        }
+        if (all(word in self.domains[var] for var, word in solution.items())
+                and self.consistent(solution)):
+            return solution
+
+        # narrowing the domains to the cached words that are still there
+        full = {var: domain.mask for var, domain in self.domains.items()}
+        for key, words in entry["domains"].items():
+            domain = self.domains[variables[key]]
+            positions = domain.index.positions
+            domain.mask &= bitmask(
+                (positions[word] for word in words if word in positions),
+                len(domain.index.words)
+            )
+
+        result = None
+        start = time.perf_counter()
+        consistent = self.ac3()
+        self.add_time("ac3", start)
+        if consistent:
+            domains = {var: domain.mask for var, domain in self.domains.items()}
+            result = self.search(strategy)
+        if result is not None:
+            cache.store(self.structure_key(), self.cache_entry(result, domains))
+        else:
+            for var, mask in full.items():
+                self.domains[var].mask = mask
+        return result
+
+    def check_budget(self):
+        """
+        Raise SearchAborted if the search is past its deadline or cancelled.
+        """
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise SearchAborted()
+        if self.cancel is not None and self.cancel.is_set():
+            raise SearchAborted()
 
     def enforce_node_consistency(self):
         """
@@ -101,19 +749,10 @@ class CrosswordCreator():
         (Remove any values that are inconsistent with a variable's unary
          constraints; in this case, the length of the word.)
         """
-        # accessing the words in the domain 
-        for domain_value in self.domains: 
-            # empty set stores words that don't meet the unary constraint 
-            inconsistent_words = set()
-            
-            # checking if the unary constraint is met
-            for word in self.domains[domain_value]: 
-                if len(word) != domain_value.length: 
-                    inconsistent_words.add(word)
-
-            # removing the inconsistent words from the domain
-            for word in inconsistent_words:
-                self.domains[domain_value].remove(word)
+        for var, domain in self.domains.items():
+            # the domain is indexed over the bucket of words with the variable's
+            # length, so clipping its mask to that bucket drops every other word
+            domain.mask &= self.index_for(var.length).full
 
     def revise(self, x, y):
         """
@@ -123,34 +762,29 @@ class CrosswordCreator():
         Return True if a revision was made to the domain of `x`; return
         False if no revision was made.
         """
-        revised = False
-
         # tuple (i, j) where x's ith character overlaps y's jth character
         overlap_loc = self.crossword.overlaps[x, y]
 
-        # checking if there is an overlapping cell between x and y  
-        if overlap_loc is not None:
-            inconsistent_words = set()
-            
-            # for words in the x domain 
-            for x_word in self.domains[x]:
-                # accessing the (i,j) overlapping tuple, where the i'th character represents x 
-                x_overlap_char = x_word[overlap_loc[0]]
-                y_overlap_chars = []
-                # finding all corresponding characters in the y domain that can go in the sane cell 
-                for y_word in self.domains[y]:
-                    y_overlap_chars.append(y_word[overlap_loc[1]])
-                # if there are no matching characters for the corresponding char in x 
-                # then remove that word from x domain
-                if x_overlap_char not in y_overlap_chars:
-                    inconsistent_words.add(x_word)
-                    revised = True
-            
-            # removing the inconsistent words 
-            for word in inconsistent_words:
-                self.domains[x].remove(word)
-        
-        return revised
+        # checking if there is an overlapping cell between x and y
+        if overlap_loc is None:
+            return False
+
+        x_letters = self.domains[x].index.letters[overlap_loc[0]]
+        y_domain = self.domains[y]
+
+        # collecting every x word whose overlapping character is still
+        # used by some word of the y domain, one mask per letter
+        supported = 0
+        for letter, y_mask in y_domain.index.letters[overlap_loc[1]].items():
+            if y_mask & y_domain.mask:
+                supported |= x_letters.get(letter, 0)
+
+        # removing the words that have no corresponding y word
+        mask = self.domains[x].mask & supported
+        if mask == self.domains[x].mask:
+            return False
+        self.restrict(x, mask)
+        return True
 
     def ac3(self, arcs=None):
         """
@@ -160,30 +794,38 @@ class CrosswordCreator():
         Return True if arc consistency is enforced and no domains are empty;
         return False if one or more domains end up empty.
         """
-         # checking for if the arc is empty  
+        # checking for if the arc is empty; every variable overlaps
+        # exactly its neighbors, so those are all the arcs there are
         if arcs is None:
-            queue = []
-            for var1 in self.crossword.variables: 
-                for var2 in self.crossword.variables: 
-                    # checking for if var1 is not equal to var2 and there is an overlap between var1 and var 2
-                    if var1 != var2 and self.crossword.overlaps[var1, var2] is not None: 
-                        # appending to the queue
-                        queue.append((var1, var2))
+            queue = deque(
+                (var, neighbor)
+                for var in self.crossword.variables
+                for neighbor in self.neighbors[var]
+            )
         else:
-            queue = arcs
-        
-        # checking whether the queue is not empty 
-        while len(queue) != 0: 
-            x, y = queue.pop(0)
+            queue = deque(arcs)
+
+        # arcs currently waiting in the queue, so none is queued twice
+        queued = set(queue)
 
+        # checking whether the queue is not empty
+        while queue:
+            x, y = queue.popleft()
+            queued.discard((x, y))
+
+            self.stats["revisions"] += 1
             if self.revise(x, y):
-                if len(self.domains[x]) == 0: 
+                if len(self.domains[x]) == 0:
                     # it is impossible to solve problem since there are no values left in domain
+                    self.fail_constraint(x, y)
+                    self.stats["wipeouts"] += 1
                     return False
-                
-                # adding neighbors of x to the list since x changed 
-                for z in (self.crossword.neighbors(x) - {y}): 
-                    queue.append((z, x))
+
+                # adding neighbors of x to the queue since x changed
+                for z in self.neighbors[x]:
+                    if z != y and (z, x) not in queued:
+                        queued.add((z, x))
+                        queue.append((z, x))
 
         return True
 
@@ -215,7 +857,7 @@ class CrosswordCreator():
         
         # checking that there are no conflicts between neighboring variables
         for key, value in assignment.items():
-            known_neighbors = self.crossword.neighbors(key).intersection(assignment.keys())
+            known_neighbors = self.neighbors[key].intersection(assignment.keys())
             for neighbor in known_neighbors:
                 # (i, j) tuple where key's ith character overlaps neighbor's jth character
                 overlap_loc = self.crossword.overlaps[key, neighbor]
@@ -227,36 +869,71 @@ class CrosswordCreator():
         
         return True
 
+    def consistent_value(self, var, value, assignment, used):
+        """
+        Return True if giving `var` the word `value` keeps the consistent
+        `assignment` consistent; return False otherwise.
+        `used` is the set of words already in `assignment`. Only the new
+        variable is checked, so this costs one check per assigned neighbor
+        instead of re-validating the whole assignment like `consistent`.
+        """
+        # checking that the word is new and has the correct length
+        if value in used or len(value) != var.length:
+            return False
+
+        # checking the overlap with every neighbor that already has a word
+        for neighbor in self.neighbors[var]:
+            if neighbor in assignment:
+                overlap_loc = self.crossword.overlaps[var, neighbor]
+                if value[overlap_loc[0]] != assignment[neighbor][overlap_loc[1]]:
+                    return False
+
+        return True
+
     def order_domain_values(self, var, assignment):
         """
         Return a list of values in the domain of `var`, in order by
         the number of values they rule out for neighboring variables.
         The first value in the list, for example, should be the one
         that rules out the fewest values among the neighbors of `var`.
+        If `self.lcv_sample` is set, a larger domain only has a random
+        sample of that many values ordered, ahead of the other values.
         """
-        # initializing all restrictions to zero
-        num_restrictions = {} 
-        for elem in self.domains[var]: 
-            num_restrictions[elem] = 0 
-        
-        # finding unassigned neighbors 
-        unassigned_neighbors = self.crossword.neighbors(var) - assignment.keys()
+        # finding unassigned neighbors and where they overlap with var
+        unassigned_neighbors = [
+            (neighbor, self.crossword.overlaps[var, neighbor])
+            for neighbor in self.neighbors[var] - assignment.keys()
+        ]
 
-        # looking for overlaps in relation to the unassigned neighbord 
-        for word_var_d in self.domains[var]:
-            for neighbor in unassigned_neighbors:
-                overlap_loc = self.crossword.overlaps[var, neighbor]
+        # a word rules out every neighbor word with another letter in the
+        # overlapping cell: the domain size minus the count of its own letter
+        histograms = [
+            (overlap_loc[0], len(self.domains[neighbor]),
+             self.domains[neighbor].histogram(overlap_loc[1]))
+            for neighbor, overlap_loc in unassigned_neighbors
+        ]
 
-                # if the i'th value not equal to the j'th value, 
-                # then add to the value of num_restrictions because of conflict 
-                for word_neighbor_d in self.domains[neighbor]:
-                    if word_var_d[overlap_loc[0]] != word_neighbor_d[overlap_loc[1]]:
-                        num_restrictions[word_var_d] += 1
-        
-        # the sorted list 
-        sorted_lst = sorted(num_restrictions.items(), key=lambda x: x[1])
+        def num_restrictions(word):
+            total = 0
+            for pos, size, histogram in histograms:
+                total += size - histogram.get(word[pos], 0)
+            return total
+
+        values = list(self.domains[var])
 
-        return [elem[0] for elem in sorted_lst]
+        # a seeded search orders equally constraining values at random
+        if self.random is not None:
+            self.random.shuffle(values)
+
+        # for a huge domain only a sample of the values is worth ordering;
+        # the sampled values are tried first and the rest keep their order
+        if self.lcv_sample is not None and len(values) > self.lcv_sample:
+            rng = self.random or random.Random(0)
+            sample = set(rng.sample(range(len(values)), self.lcv_sample))
+            head = [values[k] for k in sorted(sample)]
+            tail = [values[k] for k in range(len(values)) if k not in sample]
+            return sorted(head, key=num_restrictions) + tail
+        return sorted(values, key=num_restrictions)
 
     def select_unassigned_variable(self, assignment):
         """
@@ -265,8 +942,25 @@ class CrosswordCreator():
         in its domain. If there is a tie, choose the variable with the highest
         degree. If there is a tie, any of the tied variables are acceptable
         return values.
+        With the "mrv" heuristic this pops the heap of (domain size,
+        -degree) entries; with "wdeg" it picks the variable with the
+        smallest ratio of domain size to weighted degree.
         """
-        
+        if self.heuristic == "wdeg":
+            return self.select_weighted_variable(assignment)
+
+        # discarding entries of assigned variables and of domains that
+        # changed since, rebuilding the heap once too many have piled up
+        if self.heap is not None:
+            if len(self.heap) > 4 * len(self.domains) + 16:
+                self.heap = []
+                for var in self.crossword.variables - assignment.keys():
+                    self.push_variable(var)
+            while self.heap:
+                size, _, _, _, var = heapq.heappop(self.heap)
+                if var not in assignment and size == len(self.domains[var]):
+                    return var
+
         # finding the unassigned variables 
         unassigned_vars = self.crossword.variables - assignment.keys()
 
@@ -296,64 +990,669 @@ class CrosswordCreator():
             # break tie based on the variable among the tied variables that has the largest degree
             num_degrees = {}
             for var in ties.keys():
-                num_degrees[var] = len(self.crossword.neighbors(var))
+                num_degrees[var] = len(self.neighbors[var])
             sorted_num_degrees = sorted(num_degrees.items(), key=lambda x: x[1], reverse=True)
+
+            # a seeded search picks any of the variables with the largest degree
+            if self.random is not None:
+                best = [var for var, degree in sorted_num_degrees
+                        if degree == sorted_num_degrees[0][1]]
+                return self.random.choice(best)
             return sorted_num_degrees[0][0]
 
-    def backtrack(self, assignment):
+    def select_weighted_variable(self, assignment):
+        """
+        Return the unassigned variable with the smallest ratio of domain
+        size to weighted degree, the summed weights of its constraints with
+        unassigned neighbors (dom/wdeg).
+        """
+        best = None
+        best_score = None
+        for var in self.crossword.variables - assignment.keys():
+            weight = sum(
+                self.weights.get(frozenset((var, neighbor)), 1)
+                for neighbor in self.neighbors[var]
+                if neighbor not in assignment
+            )
+            score = len(self.domains[var]) / max(weight, 1)
+            if best is None or score < best_score:
+                best, best_score = var, score
+        return best
+
+    def count_node(self, assignment):
+        """
+        Count a search node expanded at the depth of `assignment`.
+        """
+        self.stats["nodes"] += 1
+        if len(assignment) > self.stats["max_depth"]:
+            self.stats["max_depth"] = len(assignment)
+
+    def backtrack(self, assignment, used=None):
         """
         Using Backtracking Search, take as input a partial assignment for the
         crossword and return a complete assignment if possible to do so.
         `assignment` is a mapping from variables (keys) to words (values).
+        `used` is the set of words in `assignment`, kept up to date along the
+        search so each candidate is checked incrementally.
         If no assignment is possible, return None.
         """
+        if used is None:
+            used = set(assignment.values())
+        self.check_budget()
+        self.count_node(assignment)
+
         # checking if the assignment is complete
-        if self.assignment_complete(assignment): 
-            return assignment 
+        if self.assignment_complete(assignment):
+            return assignment
 
-        # for unassignment variables 
+        # for unassignment variables
+        start = time.perf_counter()
         unassigned_var = self.select_unassigned_variable(assignment)
-        for value in self.order_domain_values(unassigned_var, assignment): 
+        self.add_time("select_variable", start)
+        start = time.perf_counter()
+        values = self.order_domain_values(unassigned_var, assignment)
+        self.add_time("order_domain_values", start)
+        for value in values:
 
-            # making a deepcopy of the assignment 
-            assignment_copy = copy.deepcopy(assignment) 
-            assignment_copy[unassigned_var] = value 
+            # checking the new value against the assigned neighbors only
+            if self.profile:
+                start = time.perf_counter()
+            consistent = self.consistent_value(unassigned_var, value, assignment, used)
+            if self.profile:
+                self.add_time("consistent", start)
+            if consistent:
 
-            # checking if the assignment copy is consistent 
-            if self.consistent(assignment_copy): 
+                # then unassigned variable is given this assignment
+                assignment[unassigned_var] = value
+                used.add(value)
+                result = self.backtrack(assignment, used)
+                if result is not None:
+                    return result
 
-                # then unassigned variable is given this assignment 
-                assignment[unassigned_var] = value 
-                result = self.backtrack(assignment) 
-                if result is not None: 
-                    return result 
+                del assignment[unassigned_var]
+                used.remove(value)
+                self.stats["backtracks"] += 1
 
-                assignment.pop(unassigned_var, None)  
-        return None 
+        # no value works with the assigned neighbors, so their constraints
+        # share the blame, and the variable goes back on the heap
+        for neighbor in self.neighbors[unassigned_var]:
+            if neighbor in assignment:
+                self.fail_constraint(unassigned_var, neighbor)
+        self.push_variable(unassigned_var)
+        return None
 
-def main():
+    def backtrack_mac(self, assignment, used=None):
+        """
+        Backtracking Search that maintains arc consistency: after each
+        assignment the neighbors of the assigned variable are revised with
+        `ac3`, so a value that empties some domain is rejected right away.
+        Pruned domains are restored from the trail when a value fails.
+        Return a complete assignment, or None if none is possible.
+        """
+        if used is None:
+            used = set(assignment.values())
+        self.check_budget()
+        self.count_node(assignment)
+
+        if self.assignment_complete(assignment):
+            return assignment
+
+        start = time.perf_counter()
+        var = self.select_unassigned_variable(assignment)
+        self.add_time("select_variable", start)
+        start = time.perf_counter()
+        values = self.order_domain_values(var, assignment)
+        self.add_time("order_domain_values", start)
+        for value in values:
+            if self.profile:
+                start = time.perf_counter()
+            consistent = self.consistent_value(var, value, assignment, used)
+            if self.profile:
+                self.add_time("consistent", start)
+            if not consistent:
+                continue
+            assignment[var] = value
+            used.add(value)
+            mark = len(self.trail)
 
-    # Check usage
-    if len(sys.argv) not in [3, 4]:
-        sys.exit("Usage: python generate.py structure words [output]")
+            # the domain of var shrinks to the chosen word, and only
+            # the arcs pointing at var can lose support because of it
+            self.restrict(var, 1 << self.domains[var].index.positions[value])
+            arcs = [
+                (neighbor, var)
+                for neighbor in self.neighbors[var] - assignment.keys()
+            ]
+            if self.profile:
+                start = time.perf_counter()
+            consistent = self.ac3(arcs)
+            if self.profile:
+                self.add_time("propagation", start)
+            if consistent:
+                result = self.backtrack_mac(assignment, used)
+                if result is not None:
+                    return result
+
+            # undoing the pruning done for this value
+            self.undo(mark)
+            del assignment[var]
+            used.remove(value)
+            self.stats["backtracks"] += 1
+        self.push_variable(var)
+        return None
+
+    def conflict_culprit(self, var, value, assignment, used):
+        """
+        Return the earliest assigned variable that rules out giving `var`
+        the word `value`, or None if `value` is consistent.
+        """
+        culprit = None
+        if value in used:
+            for other, word in assignment.items():
+                if word == value:
+                    culprit = other
+                    break
+        for neighbor in self.neighbors[var]:
+            if neighbor in assignment:
+                overlap_loc = self.crossword.overlaps[var, neighbor]
+                if value[overlap_loc[0]] != assignment[neighbor][overlap_loc[1]]:
+                    if culprit is None or self.depth[neighbor] < self.depth[culprit]:
+                        culprit = neighbor
+        return culprit
+
+    def matching_nogood(self, var, value, assignment):
+        """
+        Return a stored nogood that contains `var` = `value` and holds for
+        the rest of `assignment`, or None if there is none.
+        """
+        for nogood in self.nogood_index.get((var, value), ()):
+            if all(assignment.get(other) == word for other, word in nogood
+                   if other != var):
+                self.nogoods.move_to_end(nogood)
+                return nogood
+        return None
+
+    def add_nogood(self, nogood):
+        """
+        Store a partial assignment that cannot be completed, evicting the
+        least recently used nogood once there are `self.nogood_limit`.
+        """
+        if not nogood or nogood in self.nogoods:
+            return
+        self.nogoods[nogood] = None
+        for pair in nogood:
+            self.nogood_index.setdefault(pair, set()).add(nogood)
+        self.stats["nogoods"] += 1
+
+        if len(self.nogoods) > self.nogood_limit:
+            old, _ = self.nogoods.popitem(last=False)
+            for pair in old:
+                self.nogood_index[pair].discard(old)
+                if not self.nogood_index[pair]:
+                    del self.nogood_index[pair]
+
+    def backjump(self, assignment, used):
+        """
+        Backtracking Search with conflict-directed backjumping.
+        Every failed value is blamed on assigned variables; when all values
+        of a variable fail, the search jumps straight back to the latest
+        variable to blame, skipping the levels in between, and the blamed
+        part of the assignment is stored as a nogood so it is never tried
+        again. Return a (complete assignment or None, conflict set) pair.
+        """
+        self.check_budget()
+        self.count_node(assignment)
+
+        if self.assignment_complete(assignment):
+            return assignment, set()
+
+        start = time.perf_counter()
+        var = self.select_unassigned_variable(assignment)
+        self.add_time("select_variable", start)
+        start = time.perf_counter()
+        values = self.order_domain_values(var, assignment)
+        self.add_time("order_domain_values", start)
+
+        # the assigned variables that every value of var failed because of
+        conflict = set()
+        for value in values:
+            if self.profile:
+                start = time.perf_counter()
+            culprit = self.conflict_culprit(var, value, assignment, used)
+            if self.profile:
+                self.add_time("consistent", start)
+            if culprit is not None:
+                conflict.add(culprit)
+                continue
+
+            nogood = self.matching_nogood(var, value, assignment)
+            if nogood is not None:
+                self.stats["nogood_prunes"] += 1
+                conflict.update(other for other, _ in nogood if other != var)
+                continue
+
+            assignment[var] = value
+            used.add(value)
+            self.depth[var] = len(assignment)
+            result, child_conflict = self.backjump(assignment, used)
+            if result is not None:
+                return result, set()
+            del assignment[var]
+            del self.depth[var]
+            used.remove(value)
+            self.stats["backtracks"] += 1
+
+            # the failure below had nothing to do with var, so no other
+            # value of var can fix it: jumping back past var
+            if var not in child_conflict:
+                self.stats["backjumps"] += 1
+                self.push_variable(var)
+                return None, child_conflict
+            conflict.update(child_conflict - {var})
+
+        # no value works while the blamed variables keep their words
+        self.add_nogood(frozenset((other, assignment[other]) for other in conflict))
+        for neighbor in self.neighbors[var]:
+            if neighbor in conflict:
+                self.fail_constraint(var, neighbor)
+        self.push_variable(var)
+        return None, conflict
+
+# set in every portfolio worker process, and shared with the parent
+_portfolio_cancel = None
+
+
+def _init_portfolio_worker(cancel):
+    global _portfolio_cancel
+    _portfolio_cancel = cancel
+
+
+def _portfolio_search(crossword, strategy, heuristic, seed, timeout, options):
+    creator = CrosswordCreator(crossword)
+    assignment = creator.solve(strategy, seed=seed, timeout=timeout,
+                               cancel=_portfolio_cancel, heuristic=heuristic,
+                               **options)
+    return {
+        "strategy": strategy,
+        "heuristic": heuristic,
+        "seed": seed,
+        "assignment": assignment,
+        "timed_out": creator.timed_out,
+        "stats": creator.stats
+    }
+
+
+def portfolio_configs(workers, strategy="mac", heuristic="mrv"):
+    """
+    Return a (strategy, heuristic, seed) triple for each of `workers`
+    searches. The first search is the deterministic search with the given
+    `strategy` and `heuristic`; the rest cycle through strategies and
+    variable heuristics with different seeds.
+    """
+    mixes = [("mac", "wdeg"), ("cbj", "mrv"), ("mac", "mrv"), ("cbj", "wdeg")]
+    configs = [(strategy, heuristic, None)]
+    for k in range(1, workers):
+        strategy, heuristic = mixes[(k - 1) % len(mixes)]
+        configs.append((strategy, heuristic, k))
+    return configs
+
+
+def solve_portfolio(crossword, workers=None, timeout=None, strategy="mac",
+                    heuristic="mrv", **options):
+    """
+    Solve `crossword` with several differently seeded searches running
+    in parallel processes (see `portfolio_configs`), and return the result
+    of the first search to finish: one that found a complete assignment,
+    or one that proved there is none. The other searches are cancelled.
+    If every search runs out of the `timeout` seconds, return the result
+    of the deterministic search, which then has `timed_out` set.
+    A result is a dict with the "strategy", "heuristic" and "seed" of the
+    search, its "assignment" (or None), "timed_out" and "stats".
+    `options` are passed on to `CrosswordCreator.solve`.
+    """
+    workers = workers or os.cpu_count() or 1
+    cancel = multiprocessing.Event()
+    deadline = time.monotonic() + timeout if timeout is not None else None
+
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_portfolio_worker,
+                             initargs=(cancel,)) as executor:
+        futures = [
+            executor.submit(_portfolio_search, crossword, strategy, heuristic,
+                            seed, timeout, options)
+            for strategy, heuristic, seed
+            in portfolio_configs(workers, strategy, heuristic)
+        ]
+        pending = set(futures)
+        result = None
+        while pending and result is None:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0, deadline - time.monotonic())
+            done, pending = wait(pending, timeout=remaining,
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                finished = future.result()
+                if finished["assignment"] is not None or not finished["timed_out"]:
+                    result = finished
+                    break
+
+        # stopping the searches that are still running
+        cancel.set()
+        for future in pending:
+            future.cancel()
+
+    # the deterministic search always starts, and has returned by now
+    if result is None:
+        result = futures[0].result()
+        result["timed_out"] = True
+    return result
+
+
+def load_words(filename):
+    """
+    Load the vocabulary of a words file the same way Crossword does.
+    """
+    with open(filename) as f:
+        return set(f.read().upper().splitlines())
+
+
+# word indexes shared read-only by every batch worker process
+_batch_indexes = None
+
+
+def _init_batch_worker(indexes):
+    global _batch_indexes
+    _batch_indexes = indexes
+
+
+def _batch_solve(structure, options, output):
+    # a puzzle that cannot be read or solved fails on its own, without
+    # taking the rest of the batch down with it
+    start = time.perf_counter()
+    try:
+        return _batch_solve_puzzle(structure, options, output)
+    except Exception as e:
+        return {
+            "structure": structure,
+            "solved": False,
+            "timed_out": False,
+            "seconds": time.perf_counter() - start,
+            "stats": None,
+            "text": None,
+            "error": f"{type(e).__name__}: {e}"
+        }
+
+
+def _batch_solve_puzzle(structure, options, output):
+    # the vocabulary comes from the shared indexes, so the crossword
+    # is given an empty words file instead of re-reading the real one
+    crossword = Crossword(structure, os.devnull)
+    creator = CrosswordCreator(crossword, indexes=_batch_indexes)
+
+    start = time.perf_counter()
+    assignment = creator.solve(**options)
+    seconds = time.perf_counter() - start
+
+    if assignment is not None and output is not None:
+        name = os.path.splitext(os.path.basename(structure))[0]
+        creator.save(assignment, os.path.join(output, f"{name}.png"))
+    return {
+        "structure": structure,
+        "solved": assignment is not None,
+        "timed_out": creator.timed_out,
+        "seconds": seconds,
+        "stats": creator.stats,
+        "text": creator.text(assignment) if assignment is not None else None,
+        "error": None
+    }
+
+
+def solve_batch(directory, words, workers=None, output=None,
+                pattern="*.txt", **options):
+    """
+    Solve every structure file in `directory` whose name matches the glob
+    `pattern` with the vocabulary of the words file `words`, using a pool
+    of `workers` processes.
+    The word list is loaded and indexed once and shared by all workers.
+    Yield a result dict for each puzzle as soon as it is solved, with
+    its solve time in seconds. A puzzle that fails has its exception
+    message under "error" (None otherwise). Images are saved to `output`
+    if given. `options` are passed on to `CrosswordCreator.solve`.
+    """
+    indexes = build_indexes(load_words(words))
+    if output is not None:
+        os.makedirs(output, exist_ok=True)
+    structures = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if fnmatch.fnmatch(name, pattern)
+        and os.path.isfile(os.path.join(directory, name))
+    )
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_batch_worker,
+                             initargs=(indexes,)) as executor:
+        futures = [
+            executor.submit(_batch_solve, structure, options, output)
+            for structure in structures
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+# (grid size, number of words) of the benchmark puzzles, smallest first
+BENCHMARK_SIZES = [(5, 2000), (7, 5000), (9, 10000), (11, 20000), (13, 35000),
+                   (15, 50000)]
+BENCHMARK_SEARCHES = [("backtrack", "mrv"), ("cbj", "mrv"), ("mac", "mrv"),
+                      ("mac", "wdeg")]
+
+
+def synthetic_structure(size, rng, density=0.15):
+    """
+    Return the text of a random `size` x `size` crossword structure with
+    rotationally symmetric blocks, about `density` of the cells.
+    """
+    rows = [["_"] * size for _ in range(size)]
+    for i in range(size):
+        for j in range(size):
+            if (i, j) <= (size - 1 - i, size - 1 - j) and rng.random() < density:
+                rows[i][j] = rows[size - 1 - i][size - 1 - j] = "#"
+    return "\n".join("".join(row) for row in rows) + "\n"
+
+
+def synthetic_words(count, max_length, rng, letters="AEINORST"):
+    """
+    Return the text of a words file with `count` random words of 2 to
+    `max_length` letters, drawn from a small alphabet so that random
+    grids can be filled.
+    """
+    words = set()
+    while len(words) < count:
+        length = rng.randint(2, max_length)
+        words.add("".join(rng.choice(letters) for _ in range(length)))
+    return "\n".join(sorted(words)) + "\n"
+
+
+def benchmark(filename, seed=0, timeout=30, sizes=BENCHMARK_SIZES,
+              searches=BENCHMARK_SEARCHES):
+    """
+    Solve synthetic puzzles of increasing size with every (strategy,
+    heuristic) pair in `searches`, and write the solver statistics of
+    each run to `filename` as JSON. The puzzles only depend on `seed`,
+    so runs of different versions can be compared.
+    """
+    cases = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size, count in sizes:
+            rng = random.Random(f"{seed}-{size}-{count}")
+            structure = os.path.join(directory, f"structure{size}.txt")
+            words = os.path.join(directory, f"words{count}.txt")
+            with open(structure, "w") as f:
+                f.write(synthetic_structure(size, rng))
+            with open(words, "w") as f:
+                f.write(synthetic_words(count, size, rng))
+
+            crossword = Crossword(structure, words)
+            for strategy, heuristic in searches:
+                creator = CrosswordCreator(crossword)
+                start = time.perf_counter()
+                assignment = creator.solve(strategy, seed=seed, timeout=timeout,
+                                           heuristic=heuristic)
+                seconds = time.perf_counter() - start
+                cases.append({
+                    "size": size,
+                    "words": count,
+                    "variables": len(crossword.variables),
+                    "strategy": strategy,
+                    "heuristic": heuristic,
+                    "solved": assignment is not None,
+                    "timed_out": creator.timed_out,
+                    "seconds": seconds,
+                    "stats": creator.stats
+                })
+                print(f"{size}x{size}, {count} words, {strategy}/{heuristic}: "
+                      f"{'solved' if assignment else 'unsolved'} "
+                      f"in {seconds:.3f}s")
+
+    with open(filename, "w") as f:
+        json.dump({
+            "seed": seed,
+            "timeout": timeout,
+            "python": platform.python_version(),
+            "cases": cases
+        }, f, indent=2)
+
+
+def print_stats(stats):
+    """
+    Print solver statistics as returned by `new_stats`.
+    """
+    for name, value in stats.items():
+        if name != "seconds":
+            print(f"  {name}: {value}")
+    for phase, seconds in stats["seconds"].items():
+        print(f"  {phase} time: {seconds:.4f}s")
+
+
+def main_batch(args, cache=None):
+    """
+    Solve a directory of structures and print each result as it finishes.
+    """
+    start = time.perf_counter()
+    solved = total = failed = 0
+    results = solve_batch(
+        args.structure, args.words, args.workers, args.output,
+        pattern=args.pattern, strategy=args.strategy or "backtrack", timeout=args.timeout,
+        lcv_sample=args.lcv_sample, heuristic=args.heuristic, cache=cache,
+        profile=args.stats
+    )
+    for result in results:
+        total += 1
+        if result["error"] is not None:
+            failed += 1
+            print(f"{result['structure']}: error: {result['error']}")
+            continue
+        solved += result["solved"]
+        status = ("solved" if result["solved"] else
+                  "timed out" if result["timed_out"] else "no solution")
+        print(f"{result['structure']}: {status} in {result['seconds']:.3f}s")
+        if result["solved"]:
+            print(result["text"])
+        if args.stats:
+            print_stats(result["stats"])
+    seconds = time.perf_counter() - start
+    print(f"Solved {solved}/{total} puzzles in {seconds:.3f}s "
+          f"({total / seconds:.2f} puzzles/s), {failed} failed")
+
+
+def main():
 
     # Parse command-line arguments
-    structure = sys.argv[1]
-    words = sys.argv[2]
-    output = sys.argv[3] if len(sys.argv) == 4 else None
+    parser = argparse.ArgumentParser(
+        usage="python generate.py structure|directory words [output] "
+              "[--strategy S] [--workers N] [--timeout SECONDS] "
+              "[--heuristic H] [--lcv-sample K] [--pattern GLOB] [--cache DIR] "
+              "[--stats]\n"
+              "       python generate.py --benchmark FILE [--timeout SECONDS]"
+    )
+    parser.add_argument("structure", nargs="?")
+    parser.add_argument("words", nargs="?")
+    parser.add_argument("output", nargs="?")
+    parser.add_argument("--strategy", choices=["backtrack", "mac", "cbj"],
+                        help="search strategy (default: backtrack, or mac for "
+                             "the first search of a portfolio)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of worker processes: portfolio searches "
+                             "for one structure, or puzzles solved at once "
+                             "for a directory")
+    parser.add_argument("--timeout", type=float,
+                        help="time budget per puzzle in seconds")
+    parser.add_argument("--heuristic", choices=["mrv", "wdeg"], default="mrv",
+                        help="variable ordering heuristic")
+    parser.add_argument("--pattern", default="*.txt",
+                        help="glob matching the structure files of a "
+                             "directory (default: *.txt)")
+    parser.add_argument("--cache",
+                        help="directory of cached solutions to reuse")
+    parser.add_argument("--cache-size", type=float, default=64,
+                        help="size limit of the cache directory in MB")
+    parser.add_argument("--lcv-sample", type=int,
+                        help="only order this many values of a huge domain")
+    parser.add_argument("--stats", action="store_true",
+                        help="print solver counters and timings")
+    parser.add_argument("--benchmark", metavar="FILE",
+                        help="run the benchmark suite and write it to FILE")
+    args = parser.parse_args()
+
+    # the benchmark suite makes its own puzzles
+    if args.benchmark:
+        timeout = args.timeout if args.timeout is not None else 30
+        return benchmark(args.benchmark, timeout=timeout)
+    if args.words is None:
+        parser.error("the structure and words arguments are required")
+    cache = None
+    if args.cache:
+        cache = SolutionCache(args.cache, int(args.cache_size * 2**20))
+
+    # a directory of structures is solved as a batch
+    if os.path.isdir(args.structure):
+        return main_batch(args, cache)
 
     # Generate crossword
-    crossword = Crossword(structure, words)
+    crossword = Crossword(args.structure, args.words)
     creator = CrosswordCreator(crossword)
-    assignment = creator.solve()
+    if args.workers > 1:
+        result = solve_portfolio(crossword, args.workers, args.timeout,
+                                 strategy=args.strategy or "mac",
+                                 heuristic=args.heuristic,
+                                 lcv_sample=args.lcv_sample, cache=cache,
+                                 profile=args.stats)
+        assignment = result["assignment"]
+        timed_out = result["timed_out"]
+        stats = result["stats"]
+    else:
+        assignment = creator.solve(args.strategy or "backtrack",
+                                   timeout=args.timeout,
+                                   lcv_sample=args.lcv_sample,
+                                   heuristic=args.heuristic, cache=cache,
+                                   profile=args.stats)
+        timed_out = creator.timed_out
+        stats = creator.stats
 
     # Print result
-    if assignment is None:
+    if assignment is None and timed_out:
+        print("No solution within the time budget.")
+    elif assignment is None:
         print("No solution.")
     else:
         creator.print(assignment)
-        if output:
-            creator.save(assignment, output)
+        if args.output:
+            creator.save(assignment, args.output)
+    if args.stats and args.workers > 1:
+        print(f"Search: {result['strategy']}/{result['heuristic']}, "
+              f"seed {result['seed']}")
+    if args.stats:
+        print_stats(stats)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,19 @@
+import argparse
 import csv
+import functools
+import hashlib
+import heapq
 import itertools
+import json
+import math
+import operator
+import os
 import sys
+import tempfile
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+)
 
 PROBS = {
 
@@ -39,29 +52,105 @@ PROBS = {
 
 def main():
 
-    # Check for proper usage 
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python heredity.py data.csv")
-    people = load_data(sys.argv[1])
+    # Check for proper usage
+    parser = argparse.ArgumentParser(
+        usage="python heredity.py data.csv [--method M] [--samples N] [--chains C]\n"
+              "       python heredity.py directory|families.csv [--batch] "
+              "[--workers N] [--format F] [--output FILE] [--cache DIR]"
+    )
+    parser.add_argument("data")
+    parser.add_argument("--method", choices=sorted(METHODS) + sorted(SAMPLERS),
+                        default="eliminate",
+                        help="how the probabilities are computed")
+    parser.add_argument("--samples", type=int, default=100000,
+                        help="sample budget for the sampling methods")
+    parser.add_argument("--chains", type=int, default=4,
+                        help="independent chains for the sampling methods")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes for the parallel and sampling methods")
+    parser.add_argument("--seed", type=int,
+                        help="random seed for the sampling methods")
+    parser.add_argument("--model",
+                        help="JSON file of probabilities to use instead of "
+                             "the built-in ones")
+    parser.add_argument("--batch", action="store_true",
+                        help="treat data as many families, one per value "
+                             "of the family column")
+    parser.add_argument("--family-column", default="family",
+                        help="column naming the family of each row in a "
+                             "batch file")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl",
+                        help="output format of a batch")
+    parser.add_argument("--output", help="file to write batch results to")
+    parser.add_argument("--cache",
+                        help="directory of cached batch results to reuse")
+    args = parser.parse_args()
+    model = Model.load(args.model) if args.model else None
 
-    # Keep track of gene and trait probabilities for each person
-    probabilities = {
+    # a directory of family files is run as a batch
+    if args.batch or os.path.isdir(args.data):
+        if args.method not in METHODS:
+            parser.error("batches need an exact method")
+        return main_batch(args, model)
+    people = load_data(args.data)
+
+    # Compute gene and trait probabilities for each person
+    if args.method in SAMPLERS:
+        probabilities, diagnostics = sample_probabilities(
+            people, args.method, samples=args.samples, chains=args.chains,
+            workers=args.workers, seed=args.seed, model=model
+        )
+        for key, value in diagnostics.items():
+            print(f"{key}: {value}", file=sys.stderr)
+    elif args.method == "parallel":
+        probabilities = parallel_probabilities(people, workers=args.workers,
+                                               model=model)
+    else:
+        probabilities = METHODS[args.method](people, model=model)
+
+    # Print results
+    for person in people:
+        print(f"{person}:")
+        for field in probabilities[person]:
+            print(f"  {field.capitalize()}:")
+            for value in probabilities[person][field]:
+                p = probabilities[person][field][value]
+                print(f"    {value}: {p:.4f}") 
+
+
+def empty_probabilities(people, fill=0):
+    """
+    Return a probabilities dictionary with every probability set to 0,
+    or to `fill` (-math.inf for one that holds logs).
+    """
+    return {
         person: {
             "gene": {
-                2: 0,
-                1: 0,
-                0: 0
+                2: fill,
+                1: fill,
+                0: fill
             },
             "trait": {
-                True: 0,
-                False: 0
+                True: fill,
+                False: fill
             }
         }
         for person in people
     }
 
+
+def enumerate_probabilities(people, model=None):
+    """
+    Compute the gene and trait distributions of everyone in `people`
+    by summing `joint_probability` over every possible assignment, with
+    the probabilities of `model` (the one in `PROBS` by default).
+    """
+    # Keep track of gene and trait probabilities for each person
+    probabilities = empty_probabilities(people)
+
     # Loop over all sets of people who might have the trait
     names = set(people)
+    pedigree = Pedigree(people, model)
     for have_trait in powerset(names):
 
         # Check if current set of people violates known information
@@ -78,20 +167,1204 @@ def main():
             for two_genes in powerset(names - one_gene):
 
                 # Update probabilities with new joint probability
-                p = joint_probability(people, one_gene, two_genes, have_trait)
+                p = joint_probability(people, one_gene, two_genes, have_trait,
+                                      pedigree)
                 update(probabilities, one_gene, two_genes, have_trait, p)
 
     # Ensure probabilities sum to 1
     normalize(probabilities)
+    return probabilities
 
-    # Print results
+
+def picker(positions):
+    """
+    Return a function taking a tuple to the tuple of its items at `positions`.
+    """
+    if len(positions) == 0:
+        return lambda values: ()
+    if len(positions) == 1:
+        k = positions[0]
+        return lambda values: (values[k],)
+    return operator.itemgetter(*positions)
+
+
+class Factor():
+    """
+    Table over the gene counts of some people: `table` maps each tuple of
+    gene counts, one for every name in `names`, to a non-negative number.
+    """
+
+    def __init__(self, names, table):
+        self.names = tuple(names)
+        self.table = table
+
+    def multiply(self, other):
+        """
+        Return the product of this factor and `other`.
+        """
+        names = self.names + tuple(
+            name for name in other.names if name not in self.names
+        )
+        mine = picker([names.index(name) for name in self.names])
+        theirs = picker([names.index(name) for name in other.names])
+        return Factor(names, {
+            genes: self.table[mine(genes)] * other.table[theirs(genes)]
+            for genes in itertools.product(GENES, repeat=len(names))
+        })
+
+    def sum_out(self, name):
+        """
+        Return this factor with the gene count of `name` summed out.
+        """
+        k = self.names.index(name)
+        table = {}
+        for genes, p in self.table.items():
+            rest = genes[:k] + genes[k + 1:]
+            table[rest] = table.get(rest, 0) + p
+        return Factor(self.names[:k] + self.names[k + 1:], table)
+
+    def keep(self, names):
+        """
+        Return this factor with everyone but `names` summed out.
+        """
+        factor = self
+        for name in self.names:
+            if name not in names:
+                factor = factor.sum_out(name)
+        return factor
+
+    def normalized(self):
+        """
+        Return this factor scaled to sum to 1, which keeps messages
+        between large families of cliques from underflowing.
+        """
+        total = sum(self.table.values())
+        if total == 0:
+            return self
+        return Factor(self.names, {
+            genes: p / total for genes, p in self.table.items()
+        })
+
+
+# possible gene counts, in the order `probabilities` lists them
+GENES = (2, 1, 0)
+
+
+def inheritance(mother, father, mutation=None):
+    """
+    Return a dict mapping each gene count to the probability that a child
+    has it, given the gene counts of the mother and the father, and the
+    mutation probability (`PROBS["mutation"]` by default).
+    """
+    if mutation is None:
+        mutation = PROBS["mutation"]
+
+    # chance of passing on the gene for a parent with 2, 1 or 0 copies
+    passing = {2: 1 - mutation, 1: 0.5, 0: mutation}
+    from_mom = passing[mother]
+    from_dad = passing[father]
+    return {
+        2: from_mom * from_dad,
+        1: from_mom * (1 - from_dad) + from_dad * (1 - from_mom),
+        0: (1 - from_mom) * (1 - from_dad)
+    }
+
+
+def pedigree_factors(people, model):
+    """
+    Return one factor per person: the probability of their gene count
+    given their parents' (or unconditionally, for people without known
+    parents), times the probability of their trait if it is known, from
+    the tables of `model`.
+    """
+    factors = []
+    for person, data in people.items():
+
+        # a known trait is evidence about the gene count
+        def evidence(genes):
+            if data["trait"] is None:
+                return 1
+            return model.trait[genes][data["trait"]]
+
+        if data["mother"] is not None and data["father"] is not None:
+            table = {}
+            for mother in GENES:
+                for father in GENES:
+                    child = model.transmission[mother][father]
+                    for genes in GENES:
+                        table[genes, mother, father] = child[genes] * evidence(genes)
+            factors.append(Factor((person, data["mother"], data["father"]), table))
+        else:
+            factors.append(Factor((person,), {
+                (genes,): model.prior[genes] * evidence(genes) for genes in GENES
+            }))
+    return factors
+
+
+def elimination_order(factors):
+    """
+    Return an order in which to eliminate everyone in `factors`, always
+    taking the person with the fewest remaining neighbors (people they
+    share a factor with), which keeps the cliques small.
+    """
+    graph = {}
+    for factor in factors:
+        for name in factor.names:
+            graph.setdefault(name, set()).update(
+                other for other in factor.names if other != name
+            )
+
+    # heap of (degree, tie breaker, name) entries, skipping stale ones
+    counter = itertools.count()
+    heap = [(len(neighbors), next(counter), name) for name, neighbors in graph.items()]
+    heapq.heapify(heap)
+    order = []
+    while heap:
+        degree, _, name = heapq.heappop(heap)
+        if name not in graph or degree != len(graph[name]):
+            continue
+
+        # eliminating a person connects all of their neighbors
+        neighbors = graph.pop(name)
+        for other in neighbors:
+            graph[other].discard(name)
+            graph[other].update(neighbors - {other})
+            heapq.heappush(heap, (len(graph[other]), next(counter), other))
+        order.append(name)
+    return order
+
+
+def eliminate_probabilities(people, model=None):
+    """
+    Compute the gene and trait distributions of everyone in `people`
+    exactly, by variable elimination on the pedigree, with the
+    probabilities of `model` (the one in `PROBS` by default).
+
+    Eliminating people one at a time (see `elimination_order`) turns the
+    pedigree into a tree of cliques; one pass up the tree and one pass
+    down it give every person's gene distribution in time linear in the
+    number of people when the pedigree has few loops.
+    """
+    model = model if model is not None else Model.default()
+    factors = pedigree_factors(people, model)
+    order = elimination_order(factors)
+    position = {name: k for k, name in enumerate(order)}
+
+    # each factor belongs to the clique of the first of its people eliminated
+    potentials = [Factor((), {(): 1}) for _ in order]
+    for factor in factors:
+        k = min(position[name] for name in factor.names)
+        potentials[k] = potentials[k].multiply(factor)
+
+    # upward pass: eliminating order[k] sends a message to the clique of
+    # the first person of its scope to be eliminated next
+    up = [None] * len(order)
+    parent = [None] * len(order)
+    children = [[] for _ in order]
+    for k, name in enumerate(order):
+        product = potentials[k]
+        for child in children[k]:
+            product = product.multiply(up[child])
+        up[k] = product.sum_out(name).normalized()
+        if up[k].names:
+            parent[k] = min(position[other] for other in up[k].names)
+            children[parent[k]].append(k)
+
+    # downward pass: every clique combines what it heard from its parent
+    # with its own potential and tells each child about the rest
+    down = [None] * len(order)
+    probabilities = empty_probabilities(people)
+    for k in reversed(range(len(order))):
+        incoming = potentials[k]
+        if down[k] is not None:
+            incoming = incoming.multiply(down[k])
+        for child in children[k]:
+            message = incoming
+            for other in children[k]:
+                if other != child:
+                    message = message.multiply(up[other])
+            down[child] = message.keep(up[child].names).normalized()
+
+        belief = incoming
+        for child in children[k]:
+            belief = belief.multiply(up[child])
+        marginal = belief.keep((order[k],)).normalized()
+        for genes in GENES:
+            probabilities[order[k]]["gene"][genes] = marginal.table[(genes,)]
+
+    # a known trait is certain, an unknown one follows from the genes
+    for person, data in people.items():
+        trait = probabilities[person]["trait"]
+        if data["trait"] is None:
+            for value in (True, False):
+                trait[value] = sum(
+                    probabilities[person]["gene"][genes] * model.trait[genes][value]
+                    for genes in GENES
+                )
+        else:
+            trait[data["trait"]] = 1
+            trait[not data["trait"]] = 0
+    return probabilities
+
+
+def parents_first(people):
+    """
+    Return the names in `people` ordered so that everyone comes after
+    their mother and father.
+    """
+    order = []
+    placed = set()
     for person in people:
-        print(f"{person}:")
-        for field in probabilities[person]:
-            print(f"  {field.capitalize()}:")
-            for value in probabilities[person][field]:
-                p = probabilities[person][field][value]
-                print(f"    {value}: {p:.4f}") 
+        # walking up to the first ancestors not placed yet
+        stack = [person]
+        while stack:
+            name = stack[-1]
+            if name in placed:
+                stack.pop()
+                continue
+            data = people[name]
+            parents = [
+                parent for parent in (data["mother"], data["father"])
+                if parent is not None and parent not in placed
+            ]
+            if data["mother"] is None or data["father"] is None or not parents:
+                placed.add(name)
+                order.append(name)
+                stack.pop()
+            else:
+                stack.extend(parents)
+    return order
+
+
+def joint_assignments(people, pedigree=None, log_space=False):
+    """
+    Lazily yield (genes, traits, p) for every assignment of gene counts
+    and traits to `people` that agrees with the known traits, where
+    `genes` and `traits` map each person to their value and p is the
+    joint probability of the assignment (its log, with `log_space`).
+
+    People are assigned parents first, depth first, so each step
+    multiplies one person's probability into the product shared by every
+    assignment below it. The `genes` and `traits` dicts are reused from
+    one assignment to the next.
+    """
+    if pedigree is None:
+        pedigree = Pedigree(people)
+    model = pedigree.model
+    order = pedigree.order
+    counts = [0] * len(order)
+    genes = {}
+    traits = {}
+
+    # (gene count, trait, probability) choices for person k, given the
+    # gene counts of the people assigned before them
+    def choices(k):
+        mother = pedigree.mothers[k]
+        known = pedigree.traits[k]
+        values = (True, False) if known is None else (known,)
+        if log_space:
+            if mother < 0:
+                distribution = model.log_prior
+            else:
+                distribution = model.log_transmission[counts[mother]][counts[pedigree.fathers[k]]]
+            for count in GENES:
+                for trait in values:
+                    p = distribution[count] + model.log_trait[count][trait]
+                    if p != -math.inf:
+                        yield count, trait, p
+            return
+
+        if mother < 0:
+            distribution = model.prior
+        else:
+            distribution = model.transmission[counts[mother]][counts[pedigree.fathers[k]]]
+        for count in GENES:
+            for trait in values:
+                p = distribution[count] * model.trait[count][trait]
+                if p != 0:
+                    yield count, trait, p
+
+    empty = 0 if log_space else 1
+    if not order:
+        yield genes, traits, empty
+        return
+
+    # products[k] is the probability of the choices made for order[:k]
+    stack = [choices(order[0])]
+    products = [empty]
+    while stack:
+        depth = len(stack) - 1
+        choice = next(stack[-1], None)
+        if choice is None:
+            stack.pop()
+            products.pop()
+            continue
+
+        count, trait, p = choice
+        k = order[depth]
+        counts[k] = count
+        genes[pedigree.names[k]] = count
+        traits[pedigree.names[k]] = trait
+        p = products[-1] + p if log_space else products[-1] * p
+        if depth + 1 == len(order):
+            yield genes, traits, p
+        else:
+            products.append(p)
+            stack.append(choices(order[depth + 1]))
+
+
+def pruned_probabilities(people, model=None):
+    """
+    Compute the gene and trait distributions of everyone in `people` by
+    summing the joint probabilities from `joint_assignments`, which never
+    visits an assignment that contradicts a known trait, with the
+    probabilities of `model` (the one in `PROBS` by default).
+    """
+    probabilities = empty_probabilities(people)
+    pedigree = Pedigree(people, model)
+    for genes, traits, p in joint_assignments(people, pedigree):
+        for person in people:
+            probabilities[person]["gene"][genes[person]] += p
+            probabilities[person]["trait"][traits[person]] += p
+
+    # Ensure probabilities sum to 1
+    normalize(probabilities)
+    return probabilities
+
+
+def log_probabilities(people, model=None):
+    """
+    Compute the gene and trait distributions of everyone in `people`
+    like `pruned_probabilities`, with the probabilities of `model` (the
+    one in `PROBS` by default), keeping every product and sum in log
+    space so that tiny joint probabilities do not underflow to 0.
+    """
+    probabilities = empty_probabilities(people, -math.inf)
+    pedigree = Pedigree(people, model)
+    for genes, traits, p in joint_assignments(people, pedigree, log_space=True):
+        for person in people:
+            gene = probabilities[person]["gene"]
+            gene[genes[person]] = log_add(gene[genes[person]], p)
+            trait = probabilities[person]["trait"]
+            trait[traits[person]] = log_add(trait[traits[person]], p)
+
+    # Ensure probabilities sum to 1
+    normalize(probabilities, log_space=True)
+    return probabilities
+
+
+def probability_tables(model=None):
+    """
+    Return `model` (the one in `PROBS` by default) as NumPy arrays
+    (gene, child, trait), indexed by gene count and trait: gene[g],
+    child[mother, father, g] and trait[g, t].
+    """
+    import numpy as np
+
+    model = model if model is not None else Model.default()
+    return np.array(model.prior), np.array(model.transmission), np.array(model.trait)
+
+
+def parent_columns(people):
+    """
+    Return two integer arrays giving, for each person in the order of
+    `people`, the position of their mother and of their father, or -1
+    for people without known parents.
+    """
+    import numpy as np
+
+    pedigree = Pedigree(people)
+    return np.array(pedigree.mothers), np.array(pedigree.fathers)
+
+
+def joint_probabilities(people, genes, traits, model=None):
+    """
+    Compute the joint probabilities of a block of assignments at once.
+
+    `genes` and `traits` are integer arrays with one row per assignment
+    and one column per person, in the order of `people`: the gene count
+    (0, 1 or 2) and the trait (0 or 1) of that person. Returns an array
+    with the joint probability of each row under `model`.
+    """
+    import numpy as np
+
+    gene, child, trait = probability_tables(model)
+    mothers, fathers = parent_columns(people)
+    founders = np.flatnonzero(mothers < 0)
+    kids = np.flatnonzero(mothers >= 0)
+    mothers = mothers[kids]
+    fathers = fathers[kids]
+
+    probs = trait[genes, traits]
+    probs[:, founders] *= gene[genes[:, founders]]
+    probs[:, kids] *= child[genes[:, mothers], genes[:, fathers], genes[:, kids]]
+    return np.prod(probs, axis=1)
+
+
+def assignment_blocks(people, size):
+    """
+    Yield (genes, traits) blocks of at most `size` rows covering every
+    assignment of gene counts and traits to `people` that agrees with the
+    known traits, encoded as in `joint_probabilities`.
+    """
+    import numpy as np
+
+    names = list(people)
+    unknown = [k for k, name in enumerate(names) if people[name]["trait"] is None]
+    known = np.array([
+        bool(people[name]["trait"]) for name in names
+    ], dtype=np.int64)
+
+    # each assignment is a number whose base-3 digits are the gene counts,
+    # followed by base-2 digits for the unknown traits
+    gene_radix = 3 ** np.arange(len(names), dtype=np.int64)
+    trait_radix = 2 ** np.arange(len(unknown), dtype=np.int64)
+    total = 3 ** len(names) * 2 ** len(unknown)
+    for start in range(0, total, size):
+        index = np.arange(start, min(start + size, total), dtype=np.int64)
+        genes = index[:, None] // gene_radix % 3
+        rest = index // 3 ** len(names)
+        traits = np.repeat(known[None, :], len(index), axis=0)
+        traits[:, unknown] = rest[:, None] // trait_radix % 2
+        yield genes, traits
+
+
+def update_probabilities(probabilities, people, genes, traits, p):
+    """
+    Add the joint probabilities `p` of a block of assignments to
+    `probabilities`, one weighted bincount per distribution.
+    """
+    import numpy as np
+
+    n = len(people)
+    offsets = np.arange(n)
+    weights = np.broadcast_to(p[:, None], genes.shape).ravel()
+    gene = np.bincount((offsets * 3 + genes).ravel(), weights, minlength=3 * n)
+    trait = np.bincount((offsets * 2 + traits).ravel(), weights, minlength=2 * n)
+    for k, person in enumerate(people):
+        for g in GENES:
+            probabilities[person]["gene"][g] += float(gene[3 * k + g])
+        probabilities[person]["trait"][True] += float(trait[2 * k + 1])
+        probabilities[person]["trait"][False] += float(trait[2 * k])
+
+
+def vectorized_probabilities(people, block=2 ** 13, model=None):
+    """
+    Compute the gene and trait distributions of everyone in `people` by
+    exact enumeration, like `enumerate_probabilities`, but `block`
+    assignments at a time with NumPy table lookups.
+    """
+    probabilities = empty_probabilities(people)
+    for genes, traits in assignment_blocks(people, block):
+        p = joint_probabilities(people, genes, traits, model)
+        update_probabilities(probabilities, people, genes, traits, p)
+
+    # Ensure probabilities sum to 1
+    normalize(probabilities)
+    return probabilities
+
+
+def draw(rng, distributions):
+    """
+    Return one gene count per row of `distributions`, an array whose rows
+    are (possibly unnormalized) probabilities of gene counts 0, 1 and 2.
+    """
+    import numpy as np
+
+    cumulative = np.cumsum(distributions, axis=1)
+    u = rng.random(len(distributions)) * cumulative[:, -1]
+    return np.minimum((u[:, None] >= cumulative).sum(axis=1), 2)
+
+
+def evidence_columns(people):
+    """
+    Return an integer array giving each person's known trait (0 or 1),
+    or -1 when it is unknown, in the order of `people`.
+    """
+    import numpy as np
+
+    return np.array([
+        -1 if data["trait"] is None else int(data["trait"])
+        for data in people.values()
+    ])
+
+
+# samples that likelihood weighting draws at a time
+WEIGHTING_BLOCK = 4096
+
+
+def weighting_chain(people, samples, rng, model=None):
+    """
+    Run likelihood weighting with `samples` samples, drawn
+    `WEIGHTING_BLOCK` at a time so that memory does not grow with the
+    budget.
+
+    Everyone's gene count is drawn parents first from its prior given
+    the parents' draws, and each sample is weighted by the probability
+    of the known traits. Returns ((genes, traits), ess): the weighted
+    estimates of each person's gene distribution (one row per person,
+    indexed by gene count) and chance of having the trait, and the
+    effective sample size of the weights.
+    """
+    import numpy as np
+
+    gene, child, trait = probability_tables(model)
+    mothers, fathers = parent_columns(people)
+    known = evidence_columns(people)
+    n = len(people)
+    column = {name: k for k, name in enumerate(people)}
+    order = [column[name] for name in parents_first(people)]
+
+    # a gene count is drawn by comparing a uniform number with the chances
+    # of fewer than 1 and fewer than 2 copies, given the parents' counts
+    # as mother * 3 + father (or 9 for people without known parents)
+    cumulative = np.cumsum(np.vstack([child.reshape(9, 3), gene]), axis=1)
+    below = cumulative[:, :2] / cumulative[:, 2:]
+    with np.errstate(divide="ignore"):
+        log_trait = np.log(trait)
+
+    # weighted gene counts, and the sums of the weights and their squares,
+    # all relative to the largest log weight so far, so none can underflow
+    counts = np.zeros((n, 3))
+    total = squares = 0.0
+    top = -np.inf
+    for start in range(0, samples, WEIGHTING_BLOCK):
+        size = min(WEIGHTING_BLOCK, samples - start)
+        genes = np.empty((n, size), dtype=np.int8)
+        log_weights = np.zeros(size)
+        for k in order:
+            if mothers[k] < 0:
+                parents = 9
+            else:
+                parents = genes[mothers[k]] * 3 + genes[fathers[k]]
+            u = rng.random(size)
+            genes[k] = u >= below[parents, 0]
+            genes[k] += u >= below[parents, 1]
+            if known[k] >= 0:
+                log_weights += log_trait[genes[k], known[k]]
+
+        # a larger log weight scales down everything added up before it
+        if log_weights.max() > top:
+            scale = np.exp(top - log_weights.max())
+            counts *= scale
+            total *= scale
+            squares *= scale ** 2
+            top = log_weights.max()
+        weights = np.exp(log_weights - top)
+        total += weights.sum()
+        squares += np.sum(weights ** 2)
+        for k in range(n):
+            counts[k] += np.bincount(genes[k], weights, minlength=3)
+
+    counts /= total
+    traits = counts @ trait[:, 1]
+    traits[known >= 0] = known[known >= 0]
+    return (counts, traits), total ** 2 / squares
+
+
+# sweeps every Gibbs walker makes before its samples are kept, however
+# small the budget: the sampler mixes slowly when the mutation rate is low
+BURN_IN = 200
+
+
+def gibbs_chain(people, samples, rng, model=None, walkers=256):
+    """
+    Run Gibbs sampling on `walkers` copies of the pedigree in lockstep
+    until about `samples` samples are kept, discarding the first
+    `BURN_IN` sweeps, or a tenth of the kept sweeps if that is more, as
+    burn-in.
+
+    Each walker starts from its own overdispersed state, with every
+    founder's gene count drawn uniformly and everyone else's from their
+    parents'. Each sweep redraws everyone's gene count from its
+    distribution given everyone else's: their own prior given their
+    parents, their known trait, and the chance of each child's gene
+    count given both parents. People who share no factor are redrawn
+    together (see `gibbs_groups`), so a sweep costs one NumPy step per
+    group rather than per person. Returns ((genes, traits), halves): estimates
+    like `weighting_chain`, and how often every walker drew each gene
+    count for each person in the first and in the second half of its
+    kept sweeps, an array indexed by half, walker, person and gene count
+    (see `split_diagnostics`).
+    """
+    import numpy as np
+
+    gene, child, trait = probability_tables(model)
+    mothers, fathers = parent_columns(people)
+    known = evidence_columns(people)
+    n = len(people)
+    half = max(1, -(-samples // (2 * walkers)))
+    sweeps = 2 * half
+    burn_in = max(BURN_IN, sweeps // 10)
+
+    # gene counts are kept one row per person, so that gathering the
+    # rows of a group's parents or children copies whole rows
+    genes = np.empty((n, walkers), dtype=np.int64)
+
+    # start far apart: founders uniformly over the gene counts the prior
+    # allows, everyone else from their parents, so burn-in is visible
+    column = {name: k for k, name in enumerate(people)}
+    founder = (gene > 0).astype(float)
+    for k in (column[name] for name in parents_first(people)):
+        if mothers[k] < 0:
+            genes[k] = draw(rng, np.broadcast_to(founder, (walkers, 3)))
+        else:
+            genes[k] = draw(rng, child[genes[mothers[k]], genes[fathers[k]]])
+
+    # child[mother, father, g] is flat[9 * mother + 3 * father + g]
+    flat = child.ravel()
+
+    # how often each walker saw each gene count, in each half
+    halves = np.zeros((2, 3, n, walkers), dtype=np.int32)
+    groups = gibbs_groups(mothers, fathers, known, trait)
+    for sweep in range(burn_in + sweeps):
+        for group in groups:
+            (members, founders, group_mothers, group_fathers, evidence,
+             kids, others, steps, starts, owners) = group
+            parents = 9 * genes[group_mothers] + 3 * genes[group_fathers]
+            conditional = [
+                np.where(founders, gene[g], flat[parents + g]) * evidence[g]
+                for g in range(3)
+            ]
+
+            # the chance of each child's gene count for each candidate count
+            # of the member, multiplied together for the children of each
+            if len(kids):
+                base = np.where(steps == 9, 3, 9) * genes[others] + genes[kids]
+                for g in range(3):
+                    products = np.multiply.reduceat(flat[base + g * steps], starts)
+                    conditional[g][owners] *= products
+
+            # drawing like `draw`, on the three rows of chances at once
+            below_one = conditional[0]
+            below_two = below_one + conditional[1]
+            u = rng.random(below_two.shape) * (below_two + conditional[2])
+            drawn = (u >= below_one).astype(np.int64)
+            drawn += u >= below_two
+            genes[members] = drawn
+
+        if sweep >= burn_in:
+            for g in range(3):
+                halves[(sweep - burn_in) // half, g] += genes == g
+
+    counts = halves.sum(axis=(0, 3)).T / (sweeps * walkers)
+    traits = counts @ trait[:, 1]
+    traits[known >= 0] = known[known >= 0]
+    return (counts, traits), halves.transpose(0, 3, 2, 1)
+
+
+def gibbs_groups(mothers, fathers, known, trait):
+    """
+    Split everyone into groups of people who share no factor of the
+    pedigree (no one is a parent, child or co-parent of another in the
+    group), so a Gibbs sweep can redraw a whole group in one NumPy step,
+    given everyone else. The groups come from colouring greedily, so
+    there are about as many as the most parents, partners and children
+    anyone has, however large the pedigree.
+
+    Returns, for each group: its members; whether each has no known
+    parents; the rows of their mothers and fathers (0 for founders);
+    for each gene count, the chance of each member's known trait (1 when
+    unknown); and the children of the members, with the row of the other
+    parent and the step of the member's count in the flat transmission
+    table (9 for mothers, 3 for fathers), grouped by member, where each
+    member's children start, and the positions of those members.
+    """
+    import numpy as np
+
+    n = len(mothers)
+    neighbors = [set() for _ in range(n)]
+    families = [[] for _ in range(n)]
+    for k in np.flatnonzero(mothers >= 0):
+        m, f = mothers[k], fathers[k]
+        for a, b in ((k, m), (k, f), (m, f)):
+            neighbors[a].add(b)
+            neighbors[b].add(a)
+        families[m].append((k, f, 9))
+        families[f].append((k, m, 3))
+
+    colors = [0] * n
+    for k in range(n):
+        taken = {colors[other] for other in neighbors[k] if other < k}
+        colors[k] = next(c for c in itertools.count() if c not in taken)
+
+    groups = []
+    for color in range(max(colors, default=-1) + 1):
+        members = np.array([k for k in range(n) if colors[k] == color])
+        evidence = np.ones((3, len(members), 1))
+        for position, k in enumerate(members):
+            if known[k] >= 0:
+                evidence[:, position, 0] = trait[:, known[k]]
+        pairs = [
+            (kid, other, step, position)
+            for position, k in enumerate(members)
+            for kid, other, step in families[k]
+        ]
+        positions = np.array([pair[3] for pair in pairs], dtype=np.int64)
+        starts = np.flatnonzero(np.diff(positions, prepend=-1))
+        groups.append((
+            members, (mothers[members] < 0)[:, None],
+            np.maximum(mothers[members], 0), np.maximum(fathers[members], 0),
+            evidence,
+            np.array([pair[0] for pair in pairs], dtype=np.int64),
+            np.array([pair[1] for pair in pairs], dtype=np.int64),
+            np.array([pair[2] for pair in pairs], dtype=np.int64)[:, None],
+            starts, positions[starts]
+        ))
+    return groups
+
+
+# sampling methods, by name
+SAMPLERS = {
+    "weighting": weighting_chain,
+    "gibbs": gibbs_chain
+}
+
+
+def run_chain(method, people, samples, seed, model):
+    """
+    Run one chain of sampler `method` under `model`, seeded from `seed`,
+    a NumPy SeedSequence; a top level function so worker processes can
+    run it.
+    """
+    import numpy as np
+
+    return SAMPLERS[method](people, samples, np.random.default_rng(seed), model)
+
+
+def sample_probabilities(people, method="weighting", samples=100000,
+                         chains=4, workers=1, seed=None, model=None):
+    """
+    Estimate the gene and trait distributions of everyone in `people`
+    by sampling, for pedigrees too large for exact inference, with the
+    probabilities of `model` (the one in `PROBS` by default).
+
+    The budget of `samples` is split between `chains` independent
+    chains, run on up to `workers` processes. Each chain gets its own
+    seed spawned from `seed`, so the results do not depend on `workers`.
+    Returns (probabilities, diagnostics) where diagnostics has the
+    largest standard error of any estimated probability and the
+    effective number of samples, and for Gibbs sampling the split
+    R-hat. Gibbs diagnostics treat the first and second half of every
+    walker of every chain as separate short chains: the spread of their
+    means takes the autocorrelation of each walker into account, and
+    differs from the spread within them while the walkers still carry
+    traces of their overdispersed starts.
+    """
+    import numpy as np
+
+    chains = max(1, chains)
+    seeds = np.random.SeedSequence(seed).spawn(chains)
+    per_chain = max(1, samples // chains)
+    model = model if model is not None else Model.default()
+    jobs = [(method, people, per_chain, s, model) for s in seeds]
+    if workers == 1 or chains == 1:
+        results = [run_chain(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(run_chain, *zip(*jobs)))
+
+    # chains x people x 4 estimates: gene counts 0, 1, 2 and the trait
+    estimates = np.array([
+        np.column_stack([genes, traits]) for (genes, traits), _ in results
+    ])
+    mean = estimates.mean(axis=0)
+    diagnostics = {"method": method, "samples": per_chain * chains, "chains": chains}
+    if method == "weighting":
+        if chains > 1:
+            spread = estimates.std(axis=0, ddof=1)
+            diagnostics["stderr"] = float(np.max(spread) / np.sqrt(chains))
+        diagnostics["ess"] = float(sum(ess for _, ess in results))
+    else:
+        diagnostics.update(split_diagnostics(
+            np.concatenate([halves for _, halves in results], axis=1)
+        ))
+
+    probabilities = empty_probabilities(people)
+    for k, person in enumerate(people):
+        for g in GENES:
+            probabilities[person]["gene"][g] = float(mean[k, g])
+        probabilities[person]["trait"][True] = float(mean[k, 3])
+        probabilities[person]["trait"][False] = float(1 - mean[k, 3])
+    return probabilities, diagnostics
+
+
+def split_diagnostics(halves):
+    """
+    Return the standard error, split R-hat and effective sample size of
+    Gibbs sampling from `halves`, the gene counts of the first and the
+    second half of every walker (see `gibbs_chain`), each worst over the
+    gene probabilities that vary.
+    """
+    import numpy as np
+
+    # every half of a walker is a chain of `length` draws of an indicator
+    counts = halves.reshape(-1, *halves.shape[2:])
+    chains = len(counts)
+    length = counts[0, 0].sum()
+    if length < 2 or chains < 2:
+        return {}
+    means = counts / length
+    within = np.mean(means * (1 - means), axis=0) * length / (length - 1)
+    between = length * means.var(axis=0, ddof=1)
+    pooled = (length - 1) / length * within + between / length
+    varying = within > 0
+    if not varying.any():
+        return {"stderr": 0.0}
+
+    # the means of autocorrelated chains spread more than independent
+    # draws would, and drift between the halves before they converge
+    ess = np.minimum(chains * length * pooled / np.maximum(between, 1e-300),
+                     chains * length)
+    return {
+        "stderr": float(np.sqrt(np.max(between) / (length * chains))),
+        "rhat": float(np.max(np.sqrt(pooled[varying] / within[varying]))),
+        "ess": float(np.min(ess[varying]))
+    }
+
+
+# outer (have_trait, one_gene) pairs summed one after another into each
+# leaf of the tree that `parallel_probabilities` adds partial tables in
+LEAF_SIZE = 64
+
+
+def outer_pairs(people):
+    """
+    Return the number of (have_trait, one_gene) pairs that agree with the
+    known traits.
+    """
+    unknown = sum(1 for data in people.values() if data["trait"] is None)
+    return 2 ** (len(people) + unknown)
+
+
+def leaf_table(people, leaf, model=None):
+    """
+    Return the unnormalized distributions summed over the outer pairs in
+    `leaf`, as a flat list with five entries per person: gene counts 2,
+    1 and 0, then trait True and False.
+
+    Outer pair number i takes one_gene from the low bits of i (one bit
+    per person in `people`) and the unknown traits from the high bits;
+    two_genes runs over the subsets of everyone else, in order.
+    """
+    pedigree = Pedigree(people, model)
+    n = len(pedigree.names)
+    unknown = [k for k in range(n) if pedigree.traits[k] is None]
+    everyone = (1 << n) - 1
+    table = [0.0] * (5 * n)
+    count = outer_pairs(people)
+    for i in range(leaf * LEAF_SIZE, min((leaf + 1) * LEAF_SIZE, count)):
+        traits = [bool(trait) for trait in pedigree.traits]
+        for bit, k in enumerate(unknown):
+            traits[k] = bool(i >> (n + bit) & 1)
+
+        # every subset of everyone without one gene, smallest mask first
+        rest = everyone & ~i
+        mask = 0
+        while True:
+            genes = [
+                1 if i >> k & 1 else 2 if mask >> k & 1 else 0 for k in range(n)
+            ]
+            p = pedigree.joint_probability(genes, traits)
+            for k in range(n):
+                table[5 * k + GENES.index(genes[k])] += p
+                table[5 * k + (3 if traits[k] else 4)] += p
+            if mask == rest:
+                break
+            mask = (mask - rest) & rest
+    return table
+
+
+def tree_sum(level, index, leaves, leaf, known):
+    """
+    Return the sum of the leaf tables under node `index` at `level` of
+    a binary tree over `leaves` leaves, taking nodes from `known` when
+    they are there and computing leaf tables with `leaf` otherwise.
+
+    Every node is the sum of its left and right child, in that order,
+    so the result is the same bit for bit however it is split up.
+    """
+    if (level, index) in known:
+        return known[level, index]
+    if level == 0:
+        return leaf(index)
+    left = tree_sum(level - 1, 2 * index, leaves, leaf, known)
+    if (2 * index + 1) << (level - 1) >= leaves:
+        return left
+    right = tree_sum(level - 1, 2 * index + 1, leaves, leaf, known)
+    return [a + b for a, b in zip(left, right)]
+
+
+def shard_tables(people, start, stop, model=None):
+    """
+    Return the tree nodes covering leaves `start` to `stop` exactly, as a
+    dict mapping (level, index) to the node's table under `model`.
+    """
+    leaves = -(-outer_pairs(people) // LEAF_SIZE)
+    nodes = {}
+    while start < stop:
+        # the largest node starting at `start` that fits
+        level = 0
+        while start % (2 << level) == 0 and start + (2 << level) <= stop:
+            level += 1
+        nodes[level, start >> level] = tree_sum(
+            level, start >> level, leaves,
+            lambda leaf: leaf_table(people, leaf, model), {}
+        )
+        start += 1 << level
+    return nodes
+
+
+def parallel_probabilities(people, workers=1, shards=None, model=None):
+    """
+    Compute the gene and trait distributions of everyone in `people` by
+    exact enumeration, like `enumerate_probabilities`, split into
+    `shards` ranges of the outer (have_trait, one_gene) pairs that run
+    on up to `workers` processes, with the probabilities of `model` (the
+    one in `PROBS` by default).
+
+    The partial tables are added up in a fixed tree (see `tree_sum`), so
+    the result is bitwise the same for any number of shards or workers.
+    """
+    leaves = -(-outer_pairs(people) // LEAF_SIZE)
+    shards = max(1, min(shards or 4 * workers, leaves))
+    bounds = [leaves * k // shards for k in range(shards + 1)]
+    starts, stops = bounds[:-1], bounds[1:]
+    models = [model if model is not None else Model.default()] * shards
+    if workers == 1:
+        results = list(map(shard_tables, [people] * shards, starts, stops, models))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(
+                shard_tables, [people] * shards, starts, stops, models
+            ))
+
+    known = {}
+    for nodes in results:
+        known.update(nodes)
+    root = (leaves - 1).bit_length()
+    table = tree_sum(root, 0, leaves, None, known)
+
+    probabilities = empty_probabilities(people)
+    for k, person in enumerate(people):
+        for g, genes in enumerate(GENES):
+            probabilities[person]["gene"][genes] = table[5 * k + g]
+        probabilities[person]["trait"][True] = table[5 * k + 3]
+        probabilities[person]["trait"][False] = table[5 * k + 4]
+
+    # Ensure probabilities sum to 1
+    normalize(probabilities)
+    return probabilities
+
+
+# ways to compute the probabilities, by name
+METHODS = {
+    "enumerate": enumerate_probabilities,
+    "eliminate": eliminate_probabilities,
+    "prune": pruned_probabilities,
+    "vectorize": vectorized_probabilities,
+    "parallel": parallel_probabilities,
+    "log": log_probabilities
+}
+
+
+def load_families(source, column="family"):
+    """
+    Yield (family, people) for every family in `source`, with people as
+    `load_data` returns them. `source` is either a directory with one
+    CSV file per family, named after the family, or a single CSV file
+    whose `column` field says which family each row belongs to.
+    """
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            path = os.path.join(source, name)
+            if name.endswith(".csv") and os.path.isfile(path):
+                yield os.path.splitext(name)[0], load_data(path)
+        return
+
+    # rows of one family need not be next to each other
+    families = {}
+    with open(source) as f:
+        for row in csv.DictReader(f):
+            families.setdefault(row[column], []).append(row)
+    for family, rows in families.items():
+        yield family, read_people(rows)
+
+
+def family_key(people, method, model):
+    """
+    Return a hash of everything the result for a family depends on:
+    its people, the method and the probabilities of `model`.
+    """
+    content = json.dumps(
+        [method, list(people.values()), repr(model.probs)], sort_keys=True
+    )
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class ResultCache():
+    """
+    On-disk cache of family results, one JSON file per family content
+    hash (see `family_key`), so unchanged families are not recomputed.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, key):
+        """
+        Return the result stored under `key`, or None if there is none.
+        """
+        try:
+            with open(self.path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, key, result):
+        """
+        Save `result` under `key`.
+        """
+        # writing to a temporary file first, so that concurrent runs
+        # never read a half written result
+        fd, temp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(result, f)
+        os.replace(temp, self.path(key))
+
+
+def infer_family(family, people, method, model=None):
+    """
+    Run inference `method` on one family under `model` and return the
+    result as a JSON-ready dict, with the time it took in seconds.
+    If the family cannot be inferred (say a parent is missing from its
+    file), return a record with the error message under "error" instead
+    of the probabilities.
+    """
+    start = time.perf_counter()
+    try:
+        probabilities = METHODS[method](people, model=model)
+    except Exception as e:
+        return {
+            "family": family,
+            "method": method,
+            "seconds": time.perf_counter() - start,
+            "cached": False,
+            "error": f"{type(e).__name__}: {e}"
+        }
+    seconds = time.perf_counter() - start
+    return {
+        "family": family,
+        "method": method,
+        "seconds": seconds,
+        "cached": False,
+        "probabilities": {
+            person: {
+                "gene": {str(g): p for g, p in distributions["gene"].items()},
+                "trait": {str(t): p for t, p in distributions["trait"].items()}
+            }
+            for person, distributions in probabilities.items()
+        }
+    }
+
+
+def infer_batch(source, method="eliminate", workers=None, cache=None,
+                column="family", model=None):
+    """
+    Run inference `method` on every family in `source` (see
+    `load_families`) using a pool of `workers` processes, with the
+    probabilities of `model` (the one in `PROBS` by default). Yield a
+    result dict for each family as soon as it is done (see
+    `infer_family`). Families already in `cache`, a ResultCache, are
+    yielded straight away and not recomputed; errors are not cached.
+    At most `BATCH_BACKLOG` families per worker wait to be computed at
+    a time, so results stream out while later families are still read.
+    """
+    model = model if model is not None else Model.default()
+    limit = BATCH_BACKLOG * (workers or os.cpu_count() or 1)
+
+    def finished(done):
+        for future in done:
+            result = future.result()
+            key = futures.pop(future)
+            if cache is not None and "error" not in result:
+                cache.store(key, result)
+            yield result
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for family, people in load_families(source, column):
+            key = family_key(people, method, model)
+            result = cache.load(key) if cache is not None else None
+            if result is not None:
+                yield dict(result, family=family, cached=True)
+                continue
+            if len(futures) >= limit:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                yield from finished(done)
+            futures[executor.submit(infer_family, family, people, method,
+                                    model)] = key
+
+        yield from finished(as_completed(list(futures)))
+
+
+# families per worker process that `infer_batch` submits ahead
+BATCH_BACKLOG = 4
+
+# columns of the CSV output of `main_batch`; a family that failed gets
+# one row with only its family, seconds and error
+BATCH_FIELDS = ["family", "person", "gene_2", "gene_1", "gene_0",
+                "trait_true", "trait_false", "seconds", "cached", "error"]
+
+
+def main_batch(args, model=None):
+    """
+    Run inference on a batch of families under `model` and write each
+    result as soon as it is done, as JSON Lines or as CSV with one row
+    per person.
+    """
+    cache = ResultCache(args.cache) if args.cache else None
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    writer = None
+    if args.format == "csv":
+        writer = csv.DictWriter(output, BATCH_FIELDS)
+        writer.writeheader()
+
+    start = time.perf_counter()
+    total = cached = failed = 0
+    for result in infer_batch(args.data, args.method, args.workers, cache,
+                              args.family_column, model):
+        total += 1
+        cached += result["cached"]
+        failed += "error" in result
+        if writer is None:
+            output.write(json.dumps(result) + "\n")
+            continue
+        if "error" in result:
+            writer.writerow({
+                "family": result["family"], "seconds": result["seconds"],
+                "cached": result["cached"], "error": result["error"]
+            })
+            continue
+        for person, distributions in result["probabilities"].items():
+            gene = distributions["gene"]
+            trait = distributions["trait"]
+            writer.writerow({
+                "family": result["family"], "person": person,
+                "gene_2": gene["2"], "gene_1": gene["1"], "gene_0": gene["0"],
+                "trait_true": trait["True"], "trait_false": trait["False"],
+                "seconds": result["seconds"], "cached": result["cached"]
+            })
+
+    if output is not sys.stdout:
+        output.close()
+    seconds = time.perf_counter() - start
+    print(f"Inferred {total} families ({cached} cached, {failed} failed) "
+          f"in {seconds:.3f}s", file=sys.stderr)
 
 
 def load_data(filename):
@@ -101,46 +1374,228 @@ def load_data(filename):
     mother, father must both be blank, or both be valid names in the CSV.
     trait should be 0 or 1 if trait is known, blank otherwise.
     """
-    data = dict()
     with open(filename) as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            name = row["name"]
-            data[name] = {
-                "name": name,
-                "mother": row["mother"] or None,
-                "father": row["father"] or None,
-                "trait": (True if row["trait"] == "1" else
-                          False if row["trait"] == "0" else None)
-            }
+        return read_people(csv.DictReader(f))
+
+
+def read_people(rows):
+    """
+    Build the dictionary `load_data` returns from CSV rows, given as
+    dicts with the fields name, mother, father and trait.
+    """
+    data = dict()
+    for row in rows:
+        name = row["name"]
+        data[name] = {
+            "name": name,
+            "mother": row["mother"] or None,
+            "father": row["father"] or None,
+            "trait": (True if row["trait"] == "1" else
+                      False if row["trait"] == "0" else None)
+        }
     return data
 
 
 def powerset(s):
     """
-    Return a list of all possible subsets of set s.
+    Yield all possible subsets of set s, one at a time.
     """
     s = list(s)
-    return [
-        set(s) for s in itertools.chain.from_iterable(
-            itertools.combinations(s, r) for r in range(len(s) + 1)
+    for subset in itertools.chain.from_iterable(
+        itertools.combinations(s, r) for r in range(len(s) + 1)
+    ):
+        yield set(subset)
+
+
+@functools.lru_cache()
+def transmission_table(mutation):
+    """
+    Return the 3x3x3 table of `inheritance` probabilities, indexed by the
+    gene counts of the mother, the father and the child, for the
+    mutation probability `mutation`.
+    """
+    return tuple(
+        tuple(
+            tuple(child[g] for g in range(3))
+            for child in (
+                inheritance(mother, father, mutation) for father in range(3)
+            )
+        )
+        for mother in range(3)
+    )
+
+
+def log(p):
+    """
+    Return the natural log of probability `p`, with log(0) = -inf.
+    """
+    return math.log(p) if p > 0 else -math.inf
+
+
+def log_add(a, b):
+    """
+    Return log(exp(a) + exp(b)) without leaving log space.
+    """
+    if a < b:
+        a, b = b, a
+    if b == -math.inf:
+        return a
+    return a + math.log1p(math.exp(b - a))
+
+
+class Model():
+    """
+    The probabilities of the heredity model, in the same shape as
+    `PROBS`, compiled into tables indexed by gene count: `prior[g]` for
+    people without known parents, `transmission[m][f][g]` for a child of
+    parents with m and f copies, and `trait[g][t]`, along with
+    `log_prior`, `log_transmission` and `log_trait` holding their logs.
+    """
+
+    def __init__(self, probs):
+        self.probs = {
+            "gene": dict(probs["gene"]),
+            "trait": {g: dict(probs["trait"][g]) for g in probs["trait"]},
+            "mutation": probs["mutation"]
+        }
+        self.prior = tuple(probs["gene"][g] for g in range(3))
+        self.transmission = transmission_table(probs["mutation"])
+        self.trait = tuple(
+            (probs["trait"][g][False], probs["trait"][g][True]) for g in range(3)
+        )
+        self.log_prior = tuple(log(p) for p in self.prior)
+        self.log_transmission = tuple(
+            tuple(tuple(log(p) for p in child) for child in row)
+            for row in self.transmission
         )
-    ]
-
-# a helper function for calculating the probability for any parent: 
-def probability_for_parent(parent_name, one_gene, two_genes):
-    if parent_name in two_genes: 
-        # if the parents have two genes: 
-        prob_from_parent = 1 - PROBS["mutation"] 
-    elif parent_name in one_gene:
-        # if the parents have one gene:
-        prob_from_parent = 0.5
-    else: 
-        # probability of child getting it if parents have no genes 
-        prob_from_parent = PROBS["mutation"]
-    return prob_from_parent 
-
-def joint_probability(people, one_gene, two_genes, have_trait):
+        self.log_trait = tuple(tuple(log(p) for p in row) for row in self.trait)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load a model from a JSON file shaped like `PROBS`: gene counts and
+        traits are written as the keys "0", "1", "2" and "true", "false".
+        """
+        with open(filename) as f:
+            data = json.load(f)
+        return cls({
+            "gene": {int(g): p for g, p in data["gene"].items()},
+            "trait": {
+                int(g): {t == "true": p for t, p in table.items()}
+                for g, table in data["trait"].items()
+            },
+            "mutation": data["mutation"]
+        })
+
+    @classmethod
+    def default(cls):
+        """
+        Return the model currently in `PROBS`.
+        """
+        return cached_model((
+            tuple(PROBS["gene"].items()),
+            tuple((g, tuple(t.items())) for g, t in PROBS["trait"].items()),
+            PROBS["mutation"]
+        ))
+
+
+
+@functools.lru_cache(maxsize=8)
+def cached_model(key):
+    # `key` holds the probabilities as nested tuples of (key, value) pairs
+    gene, trait, mutation = key
+    return Model({
+        "gene": dict(gene),
+        "trait": {g: dict(table) for g, table in trait},
+        "mutation": mutation
+    })
+
+
+class Pedigree():
+    """
+    A family compiled for computing joint probabilities quickly. Everyone
+    is numbered in the order of `people`; `mothers` and `fathers` hold
+    the numbers of each person's parents, or -1 for people without
+    known parents, and `traits` their known trait or None.
+
+    `model` is a `Model`, the one in `PROBS` by default, whose tables
+    the joint probabilities are computed from.
+    """
+
+    def __init__(self, people, model=None):
+        self.names = list(people)
+        self.index = {name: k for k, name in enumerate(self.names)}
+        self.mothers = []
+        self.fathers = []
+        for name in self.names:
+            data = people[name]
+            if data["mother"] is not None and data["father"] is not None:
+                self.mothers.append(self.index[data["mother"]])
+                self.fathers.append(self.index[data["father"]])
+            else:
+                self.mothers.append(-1)
+                self.fathers.append(-1)
+        self.traits = [people[name]["trait"] for name in self.names]
+        self.people = people
+
+        self.model = model if model is not None else Model.default()
+        self.prior = self.model.prior
+        self.transmission = self.model.transmission
+        self.trait = self.model.trait
+
+    @property
+    def order(self):
+        """
+        Everyone's number, parents before their children.
+        """
+        return [self.index[name] for name in parents_first(self.people)]
+
+    def joint_probability(self, genes, traits):
+        """
+        Return the joint probability that everyone has the gene count
+        and trait given for their number in `genes` and `traits`.
+        """
+        prob = 1
+        for k, mother in enumerate(self.mothers):
+            g = genes[k]
+            if mother < 0:
+                prob_for_person = self.prior[g]
+            else:
+                prob_for_person = self.transmission[genes[mother]][genes[self.fathers[k]]][g]
+            prob *= prob_for_person * self.trait[g][traits[k]]
+        return prob
+
+    def log_joint_probability(self, genes, traits):
+        """
+        Return the log of `joint_probability`, summed in log space so it
+        does not underflow for large families.
+        """
+        model = self.model
+        total = 0
+        for k, mother in enumerate(self.mothers):
+            g = genes[k]
+            if mother < 0:
+                total += model.log_prior[g]
+            else:
+                total += model.log_transmission[genes[mother]][genes[self.fathers[k]]][g]
+            total += model.log_trait[g][traits[k]]
+        return total
+
+    def encode(self, one_gene, two_genes, have_trait):
+        """
+        Return the (genes, traits) lists of the assignment described by
+        the sets `joint_probability` takes.
+        """
+        genes = [
+            2 if name in two_genes else 1 if name in one_gene else 0
+            for name in self.names
+        ]
+        traits = [name in have_trait for name in self.names]
+        return genes, traits
+
+
+def joint_probability(people, one_gene, two_genes, have_trait, pedigree=None,
+                      log_space=False):
     """
     Compute and return a joint probability. 
 
@@ -150,63 +1605,38 @@ def joint_probability(people, one_gene, two_genes, have_trait):
         * everyone not in `one_gene` or `two_gene` does not have the gene, and
         * everyone in set `have_trait` has the trait, and
         * everyone not in set` have_trait` does not have the trait. 
-    """
 
-    # the accumulator for the probability for the person for each case: 
-    prob = 1
-
-    for person in people.keys(): 
-        trait_exists = person in have_trait 
-        if person in one_gene: 
-            if people[person]["mother"] != None and people[person]["father"] != None: 
-                # gets from mother and not father or gets from father and not mother 
-                prob_from_mom = probability_for_parent(people[person]["mother"], one_gene, two_genes)
-                # same procedure as the mother but with the father 
-                prob_from_dad = probability_for_parent(people[person]["father"], one_gene, two_genes)
-                # the probability of the person acquiring the gene if they have one gene: 
-                prob_for_person = (prob_from_mom * (1-prob_from_dad)) + (prob_from_dad * (1-prob_from_mom)) 
-            else: 
-                # if parents unkown: 
-                prob_for_person = PROBS["gene"][1] 
-            # if the person has traits, the deciding on True or False 
-            prob *= (prob_for_person * PROBS["trait"][1][trait_exists]) 
-
-        # if the person has two genes: 
-        elif person in two_genes: 
-            # checking for if parents are known: 
-            if people[person]["mother"] != None and people[person]["father"] != None: 
-                # gets from mother and not father or gets from father and not mother 
-                prob_from_mom = probability_for_parent(people[person]["mother"], one_gene, two_genes)
-                # same procedure as the mother but with the father 
-                prob_from_dad = probability_for_parent(people[person]["father"], one_gene, two_genes)
-                # probability of person acquiring gene 
-                prob_for_person = prob_from_mom * prob_from_dad
-            # if no parents: 
-            else: 
-                prob_for_person = PROBS["gene"][2]  
-            prob *= (prob_for_person * PROBS["trait"][2][trait_exists]) 
-        # if person has zero genes: 
-        else: 
-            if people[person]["mother"] != None and people[person]["father"] != None: 
-                # gets from mother and not father or gets from father and not mother 
-                prob_from_mom = probability_for_parent(people[person]["mother"], one_gene, two_genes)
-                # same procedure as the mother but with the father 
-                prob_from_dad = probability_for_parent(people[person]["father"], one_gene, two_genes)
-                prob_for_person = (1 - prob_from_mom )* (1 - prob_from_dad )
-            else: 
-                prob_for_person = PROBS["gene"][0] 
-            prob *= (prob_for_person * PROBS["trait"][0][trait_exists]) 
+    Callers computing many joint probabilities for the same people can
+    pass their `Pedigree` to save compiling it every time. With
+    `log_space`, the log of the probability is returned instead.
+    """
+    if pedigree is None:
+        pedigree = Pedigree(people)
+    genes, traits = pedigree.encode(one_gene, two_genes, have_trait)
+    if log_space:
+        return pedigree.log_joint_probability(genes, traits)
+    return pedigree.joint_probability(genes, traits)
 
-    # return the final joint probability at the end: 
-    return prob
 
-def update(probabilities, one_gene, two_genes, have_trait, p):
+def update(probabilities, one_gene, two_genes, have_trait, p, log_space=False):
     """
     Add to `probabilities` a new joint probability `p`.
     Each person should have their "gene" and "trait" distributions updated.
     Which value for each distribution is updated depends on whether
     the person is in `have_gene` and `have_trait`, respectively.
+
+    With `log_space`, `probabilities` and `p` hold logs of probabilities
+    and are added with log-sum-exp.
     """ 
+    if log_space:
+        for person in probabilities:
+            genes = 2 if person in two_genes else 1 if person in one_gene else 0
+            distributions = probabilities[person]
+            distributions["gene"][genes] = log_add(distributions["gene"][genes], p)
+            trait = person in have_trait
+            distributions["trait"][trait] = log_add(distributions["trait"][trait], p)
+        return
+
     for person in probabilities.keys():
         if person in one_gene:
             # adding p to the part of the dictionary with the appropriate number of genes for each case 
@@ -221,11 +1651,24 @@ def update(probabilities, one_gene, two_genes, have_trait, p):
         else: 
             probabilities[person]['trait'][False] += p 
 
-def normalize(probabilities): 
+def normalize(probabilities, log_space=False): 
     """
     Update `probabilities` such that each probability distribution
     is normalized (i.e., sums to 1, with relative proportions the same).
+
+    With `log_space`, `probabilities` holds logs of unnormalized
+    probabilities, which are replaced by the normalized probabilities.
     """ 
+    if log_space:
+        for distributions in probabilities.values():
+            for distribution in distributions.values():
+                total = -math.inf
+                for value in distribution.values():
+                    total = log_add(total, value)
+                for elem in distribution:
+                    distribution[elem] = math.exp(distribution[elem] - total)
+        return
+
     for person in probabilities.keys(): 
         total = 0 # accumulator 
         # normalizing the probability distribution for genes by dividing the element by the total 
@@ -1,6 +1,15 @@
+import argparse
 import itertools
+import json
+import math
+import platform
 import random
-import copy 
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 
 
 class Minesweeper():
@@ -13,23 +22,24 @@ class Minesweeper():
         # Set initial width, height, and number of mines
         self.height = height
         self.width = width
-        self.mines = set()
-
-        # Initialize an empty field with no mines
-        self.board = []
-        for i in range(self.height):
-            row = []
-            for j in range(self.width):
-                row.append(False)
-            self.board.append(row)
 
-        # Add mines randomly
-        while len(self.mines) != mines:
-            i = random.randrange(height)
-            j = random.randrange(width)
-            if not self.board[i][j]:
-                self.mines.add((i, j))
-                self.board[i][j] = True
+        # Add mines at distinct random cells, drawn all at once rather
+        # than retried until free, which is slow on dense boards
+        rng = np.random.default_rng(random.getrandbits(64))
+        positions = rng.choice(height * width, size=mines, replace=False)
+        self.board = np.zeros((height, width), dtype=bool)
+        self.board.flat[positions] = True
+        self.mines = set(zip((positions // width).tolist(),
+                             (positions % width).tolist()))
+
+        # Count the mines around every cell once: the sum over each 3x3
+        # neighborhood (a convolution of the board), less the cell itself
+        padded = np.pad(self.board, 1).astype(np.uint8)
+        self.counts = np.zeros((height, width), dtype=np.uint8)
+        for di in range(3):
+            for dj in range(3):
+                self.counts += padded[di:di + height, dj:dj + width]
+        self.counts -= self.board
 
         # At first, player has found no mines
         self.mines_found = set()
@@ -51,7 +61,7 @@ class Minesweeper():
 
     def is_mine(self, cell):
         i, j = cell
-        return self.board[i][j] 
+        return bool(self.board[i, j])
 
     def nearby_mines(self, cell):
         """
@@ -59,24 +69,47 @@ class Minesweeper():
         within one row and column of a given cell,
         not including the cell itself.
         """
+        i, j = cell
+        return int(self.counts[i, j])
 
-        # Keep count of nearby mines
-        count = 0
-
-        # Loop over all cells within one row and column
-        for i in range(cell[0] - 1, cell[0] + 2):
-            for j in range(cell[1] - 1, cell[1] + 2):
-
-                # Ignore the cell itself
-                if (i, j) == cell:
-                    continue
-
-                # Update count if cell in bounds and is mine
-                if 0 <= i < self.height and 0 <= j < self.width:
-                    if self.board[i][j]:
-                        count += 1
-
-        return count
+    def reveal(self, cell):
+        """
+        Returns the cells uncovered by clicking on the safe `cell`: `cell`
+        itself and, if it has no nearby mines, every cell of the region
+        of such cells around it along with the cells bordering that
+        region. They come as an array with a (row, column) row per cell,
+        and an array of the number of mines near each of them.
+        """
+        width = self.width
+        counts = self.counts.ravel()
+        start = cell[0] * width + cell[1]
+        visited = np.zeros(self.height * width, dtype=bool)
+        visited[start] = True
+        frontier = np.array([start])
+        revealed = [frontier]
+
+        # where each cell last appeared in a layer, to drop the repeats
+        # of cells next to several cells of the layer without sorting
+        slot = np.empty(self.height * width, dtype=np.int64)
+
+        # breadth first, one whole layer of the region at a time
+        rows = np.array([-1, -1, -1, 0, 0, 1, 1, 1])
+        cols = np.array([-1, 0, 1, -1, 1, -1, 0, 1])
+        while frontier.size:
+            empty = frontier[counts[frontier] == 0]
+            i = empty[:, None] // width + rows
+            j = empty[:, None] % width + cols
+            inside = (i >= 0) & (i < self.height) & (j >= 0) & (j < width)
+            neighbors = (i * width + j)[inside]
+            neighbors = neighbors[~visited[neighbors]]
+            positions = np.arange(neighbors.size)
+            slot[neighbors] = positions
+            frontier = neighbors[slot[neighbors] == positions]
+            visited[frontier] = True
+            revealed.append(frontier)
+
+        cells = np.concatenate(revealed)
+        return np.column_stack(np.divmod(cells, width)), counts[cells]
 
     def won(self):
         """
@@ -137,17 +170,234 @@ class Sentence():
         if cell in self.cells: 
             self.cells.remove(cell) 
 
+# largest frontier component solved by trying every way to place mines
+MAX_ENUMERATION = 24
+
+
+def eliminate(cells, sentences):
+    """
+    Returns the (safes, mines) among `cells` that follow from the
+    `sentences` about them.
+
+    Every sentence is an equation: the sum of its cells, each 0 or 1, is
+    its count. Gaussian elimination on the 0/1 matrix of the equations,
+    kept sparse and in integers, combines overlapping sentences. A
+    reduced equation whose count equals the least (or greatest) sum its
+    coefficients can reach then fixes every cell in it.
+    """
+    column = {cell: k for k, cell in enumerate(cells)}
+    rows = [
+        ({column[cell]: 1 for cell in sentence.cells}, sentence.count)
+        for sentence in sentences
+    ]
+
+    pivoted = 0
+    for col in range(len(cells)):
+        pivot = next(
+            (k for k in range(pivoted, len(rows)) if col in rows[k][0]), None
+        )
+        if pivot is None:
+            continue
+        rows[pivoted], rows[pivot] = rows[pivot], rows[pivoted]
+        coefficients, count = rows[pivoted]
+        p = coefficients[col]
+        for k, (other, other_count) in enumerate(rows):
+            if k == pivoted or col not in other:
+                continue
+            q = other[col]
+            combined = {}
+            for c in coefficients.keys() | other.keys():
+                value = p * other.get(c, 0) - q * coefficients.get(c, 0)
+                if value:
+                    combined[c] = value
+            combined_count = p * other_count - q * count
+
+            # keep the numbers small
+            divisor = math.gcd(combined_count, *combined.values())
+            if divisor > 1:
+                combined = {c: value // divisor for c, value in combined.items()}
+                combined_count //= divisor
+            rows[k] = (combined, combined_count)
+        pivoted += 1
+
+    safes = set()
+    mines = set()
+    for coefficients, count in rows:
+        low = sum(value for value in coefficients.values() if value < 0)
+        high = sum(value for value in coefficients.values() if value > 0)
+        if count == low:
+            for c, value in coefficients.items():
+                (safes if value > 0 else mines).add(cells[c])
+        elif count == high:
+            for c, value in coefficients.items():
+                (mines if value > 0 else safes).add(cells[c])
+    return safes, mines
+
+
+def enumerate_solutions(cells, sentences):
+    """
+    Tries every way to place mines in `cells` that satisfies all of the
+    `sentences` about them. Returns a dict mapping each number of mines
+    to [number of solutions with that many mines, list of how many of
+    those solutions have a mine in each of `cells`].
+    """
+    position = {cell: k for k, cell in enumerate(cells)}
+    counts = [sentence.count for sentence in sentences]
+    left = [len(sentence.cells) for sentence in sentences]
+    placed = [0] * len(sentences)
+    members = [[] for _ in cells]
+    for s, sentence in enumerate(sentences):
+        for cell in sentence.cells:
+            members[position[cell]].append(s)
+
+    solutions = {}
+    assignment = [0] * len(cells)
+
+    def place(k):
+        if k == len(cells):
+            mines = sum(assignment)
+            entry = solutions.setdefault(mines, [0, [0] * len(cells)])
+            entry[0] += 1
+            for c, value in enumerate(assignment):
+                entry[1][c] += value
+            return
+        for value in (0, 1):
+            assignment[k] = value
+            consistent = True
+            for s in members[k]:
+                placed[s] += value
+                left[s] -= 1
+                if placed[s] > counts[s] or placed[s] + left[s] < counts[s]:
+                    consistent = False
+            if consistent:
+                place(k + 1)
+            for s in members[k]:
+                placed[s] -= value
+                left[s] += 1
+        assignment[k] = 0
+
+    place(0)
+    return solutions
+
+
+def solve_component(cells, sentences, solutions=None):
+    """
+    Returns the (safes, mines) that follow from the `sentences` about a
+    connected frontier component `cells`, by elimination, or by trying
+    every placement of mines if that finds nothing and the component is
+    small enough. `solutions` is the result of `enumerate_solutions` for
+    the component, if it is already known.
+    """
+    safes, mines = eliminate(cells, sentences)
+    if safes or mines or len(cells) > MAX_ENUMERATION:
+        return safes, mines
+
+    if solutions is None:
+        solutions = enumerate_solutions(cells, sentences)
+    total = sum(number for number, _ in solutions.values())
+    if total == 0:
+        return safes, mines
+    for c, cell in enumerate(cells):
+        with_mine = sum(per_cell[c] for _, per_cell in solutions.values())
+        if with_mine == 0:
+            safes.add(cell)
+        elif with_mine == total:
+            mines.add(cell)
+    return safes, mines
+
+
+def convolve(a, b):
+    """
+    Returns the distribution of the total number of mines of two
+    independent parts with `a` and `b` mapping mine counts to weights.
+    """
+    total = {}
+    for i, x in a.items():
+        for j, y in b.items():
+            total[i + j] = total.get(i + j, 0) + x * y
+    return total
+
+
+def mine_probabilities(components, unconstrained, remaining):
+    """
+    Returns (probabilities, other): the chance that each cell of the
+    enumerated frontier `components`, given as (cells, solutions) pairs
+    with solutions from `enumerate_solutions`, is a mine, and the chance
+    for each of the `unconstrained` cells no sentence mentions.
+
+    Each way of placing mines in the components is weighted by the number
+    of ways to place the rest of the `remaining` mines among the
+    unconstrained cells. If `remaining` is None, the components are
+    weighed on their own and `other` is None.
+    """
+    counts = [
+        {mines: entry[0] for mines, entry in solutions.items()}
+        for _, solutions in components
+    ]
+
+    def weight(mines):
+        if remaining is None:
+            return 1
+        rest = remaining - mines
+        return math.comb(unconstrained, rest) if 0 <= rest <= unconstrained else 0
+
+    # distributions of the mines in all components before and after each
+    prefix = [{0: 1}]
+    for count in counts:
+        prefix.append(convolve(prefix[-1], count))
+    suffix = [{0: 1}]
+    for count in reversed(counts):
+        suffix.append(convolve(suffix[-1], count))
+    suffix.reverse()
+
+    everything = prefix[-1]
+    total = sum(ways * weight(mines) for mines, ways in everything.items())
+    if total == 0:
+        if remaining is not None:
+            return mine_probabilities(components, unconstrained, None)
+        return {}, None
+
+    probabilities = {}
+    for k, (cells, solutions) in enumerate(components):
+        others = convolve(prefix[k], suffix[k + 1])
+        if remaining is None:
+            others = {0: 1}
+        component_total = 0
+        with_mine = [0] * len(cells)
+        for mines, (ways, per_cell) in solutions.items():
+            w = sum(n * weight(mines + m) for m, n in others.items())
+            component_total += ways * w
+            for c, n in enumerate(per_cell):
+                with_mine[c] += n * w
+        for c, cell in enumerate(cells):
+            probabilities[cell] = with_mine[c] / component_total
+
+    other = None
+    if remaining is not None and unconstrained > 0:
+        other = sum(
+            ways * weight(mines) * (remaining - mines)
+            for mines, ways in everything.items()
+        ) / (total * unconstrained)
+    return probabilities, other
+
+
 class MinesweeperAI():
     """
     Minesweeper game player
     """
 
-    def __init__(self, height=8, width=8):
+    def __init__(self, height=8, width=8, mines=None, guess="probability"):
 
         # Set initial height and width
         self.height = height
         self.width = width
 
+        # total number of mines, if known, and how to choose a move
+        # when no move is known to be safe: "probability" picks the
+        # cell least likely to be a mine, "random" any unexplored cell
+        self.total_mines = mines
+        self.guess = guess
+
         # Keep track of which cells have been clicked on
         self.moves_made = set()
 
@@ -155,8 +405,76 @@ class MinesweeperAI():
         self.mines = set()
         self.safes = set()
 
-        # List of sentences about the game known to be true
-        self.knowledge = []
+        # safe cells not clicked on yet
+        self.safe_moves = set()
+
+        # Sentences about the game known to be true, by their cells, and
+        # for each cell the cells of every sentence it appears in
+        self.sentences = {}
+        self.index = {}
+
+        # cells of the sentences added or changed since inference last
+        # looked at them
+        self.worklist = deque()
+
+        # cells in sentences added since the frontier was last solved
+        self.touched = set()
+
+        # cells neither clicked on nor known to be mines, with the
+        # position of each cell in the list
+        self.unexplored = [
+            (i, j) for i in range(height) for j in range(width)
+        ]
+        self.position = {cell: k for k, cell in enumerate(self.unexplored)}
+
+        # solutions of frontier components, by the cells of their sentences
+        self.solutions = {}
+
+    def explore(self, cell):
+        """
+        Removes `cell` from the unexplored cells.
+        """
+        k = self.position.pop(cell, None)
+        if k is None:
+            return
+        last = self.unexplored.pop()
+        if last != cell:
+            self.unexplored[k] = last
+            self.position[last] = k
+
+    @property
+    def knowledge(self):
+        """
+        List of sentences about the game known to be true.
+        """
+        return list(self.sentences.values())
+
+    def add_sentence(self, cells, count):
+        """
+        Adds the sentence that `count` of `cells` are mines to the
+        knowledge base, unless it is empty or already known, and queues
+        it for inference.
+        """
+        cells = frozenset(cells)
+        if not cells or cells in self.sentences:
+            return
+        self.sentences[cells] = Sentence(cells, count)
+        for cell in cells:
+            self.index.setdefault(cell, set()).add(cells)
+        self.worklist.append(cells)
+        self.touched.update(cells)
+
+    def remove_sentence(self, cells):
+        """
+        Removes the sentence about `cells` from the knowledge base and
+        returns it.
+        """
+        sentence = self.sentences.pop(cells)
+        for cell in cells:
+            self.index[cell].discard(cells)
+            if not self.index[cell]:
+                del self.index[cell]
+        return sentence
 
     def mark_mine(self, cell): 
         """
@@ -164,8 +482,13 @@ class MinesweeperAI():
         to mark that cell as a mine as well.
         """ 
         self.mines.add(cell) 
-        for sentence in self.knowledge: 
+        self.explore(cell)
+
+        # only the sentences mentioning the cell change
+        for cells in list(self.index.get(cell, ())):
+            sentence = self.remove_sentence(cells)
             sentence.mark_mine(cell)
+            self.add_sentence(sentence.cells, sentence.count)
 
     def mark_safe(self, cell):
         """
@@ -173,8 +496,12 @@ class MinesweeperAI():
         to mark that cell as safe as well.
         """
         self.safes.add(cell)
-        for sentence in self.knowledge:
+        if cell not in self.moves_made:
+            self.safe_moves.add(cell)
+        for cells in list(self.index.get(cell, ())):
+            sentence = self.remove_sentence(cells)
             sentence.mark_safe(cell)
+            self.add_sentence(sentence.cells, sentence.count)
 
     def add_knowledge(self, cell, count): 
         """ 
@@ -193,89 +520,114 @@ class MinesweeperAI():
         """ 
         # step 1 
         self.moves_made.add(cell) 
+        self.safe_moves.discard(cell)
+        self.explore(cell)
 
         # step 2 
         self.mark_safe(cell)
 
-        # step 3 
-        i, j = cell
-        cells_to_add = []
-        for row in range(i-1, i+2, 1):
-            for col in range(j-1, j+2, 1): 
-                if not row < 0 and not col < 0 and not row >= self.width and not col >= self.height and not (row == i and col == j):
-                    cell_to_check = (row, col)
-                    if not cell_to_check in self.moves_made:
-                        if cell_to_check in self.mines:
-                            count -= 1
-                        elif cell in self.safes:  
-                            continue 
-                        else:
-                            cells_to_add.append((row, col))
-        self.knowledge.append(Sentence(set(cells_to_add), count)) 
-
-        knowledge_copy = copy.deepcopy(self.knowledge) 
-        for sentence in knowledge_copy:
-            if len(sentence.known_safes()) != 0:
-                for safe_cell in sentence.cells:
-                    self.mark_safe(safe_cell)
-            elif len(sentence.known_mines()) != 0:
-                for mine_cell in sentence.cells:
-                    self.mark_mine(mine_cell)
-                    
-        # steps 3 and 4
+        # step 3: the neighbors whose state is unknown, leaving out the
+        # known mines from the count
         i, j = cell
-        cells_to_add = []
-        for row in range(i-1, i+2, 1):
-            for col in range(j-1, j+2, 1): 
-                # make sure the i and j are within the height by width 
-                # (row, col) != cell 
-                cell_to_check = (row, col)
-                if not row < 0 and not col < 0 and not row >= self.width and not col >= self.height and not (row == i and col == j):
-                    if not cell_to_check in self.moves_made:  
-                        if cell_to_check in self.mines:  
-                            count -= 1 
-                            # self.knowledge.mark_mine(Sentence(set(cells_to_add), count))  
-                        elif cell_to_check in self.safes:  
-                            continue 
-                        else: 
-                            cells_to_add.append((row, col)) 
-        self.knowledge.append(Sentence(set(cells_to_add), count)) 
-        
-        # step 5 
-        # make a copy of the knowledge base, and then iterate through the copy 
-        # keep track of new sentences in the KB 
-        # every time somethign new in og KB, keep making a new copy and then iterate through it --> use a while loop.  
-        change = True  
-        while change:  
-            change = False   
-            knowledge_copy = copy.deepcopy(self.knowledge) 
-            for sentence in knowledge_copy: 
-                # sentence.cells => set 
-                # sentence.count => count
-                # write a method where we find if sentence.cells is a subset of any other sentence's cells 
-                # keep track of every inference until you can't do anything - keep track of every sentence being added, and then go back and create another copy
-                # iterating over cells, and seeing if those cells are in self.safes, if the sentence's safe cells not in self.sales, update self.cells to add these cell sin self.sales
-                safe_cells = list(sentence.known_safes())
-                mines = list(sentence.known_mines()) 
-                for cell in safe_cells: 
-                    if cell not in self.safes: 
-                        self.mark_safe(cell) 
-                        change = True 
-                for cell in mines: 
-                    if cell not in self.mines: 
-                        self.mark_mine(cell)   
-                        change = True     
-                for other_sentence in knowledge_copy: 
-                    if other_sentence != sentence: 
-                        if sentence.cells: 
-                            if sentence.cells.issubset(other_sentence.cells): 
-                                new_sentence = Sentence(other_sentence.cells.difference(sentence.cells), other_sentence.count - sentence.count)
-                                if new_sentence not in self.knowledge: 
-                                    self.knowledge.append(new_sentence)  
-                                    change = True 
-
-    # iterate through every sentence in self.knowledge and see if it has safe cells that is not in AI's self.safe variable --> do it for mines as well 
-    # keep track of self.safes and self.mines updating 
+        cells = set()
+        for row in range(i - 1, i + 2):
+            for col in range(j - 1, j + 2):
+                neighbor = (row, col)
+                if neighbor == cell or not (0 <= row < self.height and 0 <= col < self.width):
+                    continue
+                if neighbor in self.mines:
+                    count -= 1
+                elif neighbor not in self.safes:
+                    cells.add(neighbor)
+        self.add_sentence(cells, count)
+
+        # steps 4 and 5, solving the frontier only once sentences one
+        # or two at a time leave no safe move to make
+        self.infer()
+        while self.make_safe_move() is None and self.solve_frontier():
+            self.infer()
+
+    def infer(self):
+        """
+        Draws every conclusion that follows from the queued sentences:
+        marks the cells of a sentence as safes or mines when its count
+        allows only one answer, and adds the difference of any two
+        sentences when one's cells are a subset of the other's. Each
+        sentence is compared only with the sentences it shares a cell
+        with, and is looked at again only when it changes.
+        """
+        while self.worklist:
+            cells = self.worklist.popleft()
+            sentence = self.sentences.get(cells)
+            if sentence is None:
+                continue
+
+            safes = sentence.known_safes()
+            mines = sentence.known_mines()
+            if safes or mines:
+                for cell in list(safes):
+                    self.mark_safe(cell)
+                for cell in list(mines):
+                    self.mark_mine(cell)
+                continue
+
+            overlapping = set()
+            for cell in cells:
+                overlapping.update(self.index[cell])
+            overlapping.discard(cells)
+            for other in overlapping:
+                count = self.sentences[other].count
+                if cells < other:
+                    self.add_sentence(other - cells, count - sentence.count)
+                elif other < cells:
+                    self.add_sentence(cells - other, sentence.count - count)
+
+    def component(self, cell):
+        """
+        Returns the cells and the sentences (by their cells) connected to
+        `cell` by sharing cells with one another.
+        """
+        cells = {cell}
+        keys = set()
+        stack = [cell]
+        while stack:
+            for key in self.index.get(stack.pop(), ()):
+                if key not in keys:
+                    keys.add(key)
+                    for other in key - cells:
+                        cells.add(other)
+                        stack.append(other)
+        return cells, keys
+
+    def solve_frontier(self):
+        """
+        Solves every frontier component with cells in sentences added
+        since the last call, marking the cells it shows to be safe or
+        mines. Returns whether any cell was marked.
+        """
+        touched = self.touched
+        self.touched = set()
+        seen = set()
+        found = False
+        for cell in touched:
+            if cell in seen or cell not in self.index:
+                continue
+            cells, keys = self.component(cell)
+            seen.update(cells)
+            cells = sorted(cells)
+            safes, mines = solve_component(
+                cells, [self.sentences[key] for key in keys],
+                self.solutions.get(frozenset(keys))
+            )
+            for safe in safes:
+                if safe not in self.safes:
+                    self.mark_safe(safe)
+                    found = True
+            for mine in mines:
+                if mine not in self.mines:
+                    self.mark_mine(mine)
+                    found = True
+        return found
 
     def make_safe_move(self): 
         """
@@ -286,31 +638,288 @@ class MinesweeperAI():
         This function may use the knowledge in self.mines, self.safes
         and self.moves_made, but should not modify any of those values. 
         """         
-        for cell in self.safes: 
-            if cell not in self.moves_made:  
-                return cell 
+        for cell in self.safe_moves:
+            return cell
         # Ask what to return if no more safe moves 
         return None 
 
     def make_random_move(self):
         """
         Returns a move to make on the Minesweeper board.
-        Should choose randomly among cells that:
+        Should choose among cells that:
             1) have not already been chosen, and
             2) are not known to be mines
+        With the "random" guess, any such cell is chosen at random;
+        otherwise the cell least likely to be a mine is (see
+        `mine_probabilities`). Without the total number of mines, cells
+        no sentence mentions cannot be weighed against the frontier, and
+        are chosen first.
         """
-        board = []
-        for i in range(self.height):
-            for j in range(self.width):
-                board.append((i, j))
-
-        board = set(board) 
-        excluded_moves = self.moves_made.union(self.mines)
-        relevant_moves = board.difference(excluded_moves)
+        if not self.unexplored:
+            return None
+        if self.guess == "random":
+            return random.choice(self.unexplored)
+
+        probabilities, other = self.probabilities()
+        best = min(probabilities, key=probabilities.get, default=None)
+        unconstrained = len(self.unexplored) - len(self.index) - len(self.safe_moves)
+        if unconstrained > 0 and (
+            best is None or other is None or other < probabilities[best]
+        ):
+            return self.unconstrained_cell()
+        if best is None:
+            return random.choice(self.unexplored)
+        return best
+
+    def probabilities(self):
+        """
+        Returns the chance that each frontier cell is a mine, and the
+        chance for a cell no sentence mentions (None if the number of
+        mines is unknown). Components too large to enumerate get the
+        highest share of mines among the sentences about each cell, and
+        the mines expected in them (from disjoint sentences where there
+        are some) are not shared out among the other cells.
+        Component solutions are kept for the next call.
+        """
+        components = []
+        probabilities = {}
+        solutions = {}
+        seen = set()
+        expected = 0
+        for cell in self.index:
+            if cell in seen:
+                continue
+            cells, keys = self.component(cell)
+            seen.update(cells)
+            cells = sorted(cells)
+            if len(cells) > MAX_ENUMERATION:
+                for c in cells:
+                    probabilities[c] = max(
+                        self.sentences[key].count / len(key) for key in self.index[c]
+                    )
+
+                # disjoint sentences give their exact number of mines,
+                # and the cells none of them covers their estimates
+                covered = set()
+                for key in sorted(keys, key=len, reverse=True):
+                    if covered.isdisjoint(key):
+                        covered.update(key)
+                        expected += self.sentences[key].count
+                expected += sum(probabilities[c] for c in cells if c not in covered)
+                continue
+            key = frozenset(keys)
+            if key not in self.solutions:
+                self.solutions[key] = enumerate_solutions(
+                    cells, [self.sentences[k] for k in keys]
+                )
+            solutions[key] = self.solutions[key]
+            components.append((cells, solutions[key]))
+
+        # components that changed since last time are not needed any more
+        self.solutions = solutions
+
+        # the expected mines of oversized components are taken off the
+        # mines left for the enumerated components and unconstrained cells
+        remaining = None
+        if self.total_mines is not None:
+            remaining = max(0, self.total_mines - len(self.mines) - round(expected))
+        unconstrained = len(self.unexplored) - len(self.index) - len(self.safe_moves)
+        enumerated, other = mine_probabilities(components, unconstrained, remaining)
+        probabilities.update(enumerated)
+        return probabilities, other
+
+    def unconstrained_cell(self):
+        """
+        Returns a random unexplored cell that no sentence mentions and
+        that is not known to be safe.
+        """
+        for _ in range(100):
+            cell = random.choice(self.unexplored)
+            if cell not in self.index and cell not in self.safes:
+                return cell
+        candidates = [
+            cell for cell in self.unexplored
+            if cell not in self.index and cell not in self.safes
+        ]
+        return random.choice(candidates)
+
+def play_game(height, width, mines, seed, guess="probability", know_mines=True,
+              flood=False):
+    """
+    Plays one game between `Minesweeper` and `MinesweeperAI` without a
+    display, with every random choice seeded from `seed`. With `flood`,
+    clicking a cell with no nearby mines tells the AI about the whole
+    region `Minesweeper.reveal` uncovers, as the game would show it;
+    every cell it learns about counts as a move. Returns a dict
+    with the outcome, the number of moves and guesses, the time spent,
+    the latency of each `add_knowledge` call in seconds and the number
+    of sentences in the knowledge base after each move.
+    """
+    random.seed(seed)
+    game = Minesweeper(height, width, mines)
+    ai = MinesweeperAI(height, width, mines if know_mines else None, guess)
+
+    latencies = []
+    knowledge = []
+    guesses = 0
+    won = False
+    start = time.perf_counter()
+    while True:
+        if len(ai.moves_made) == height * width - mines:
+            won = True
+            break
+        move = ai.make_safe_move()
+        if move is None:
+            move = ai.make_random_move()
+            guesses += 1
+            if move is None or game.is_mine(move):
+                break
+        if flood:
+            cells, counts = game.reveal(move)
+            uncovered = zip(map(tuple, cells.tolist()), counts.tolist())
+        else:
+            uncovered = [(move, game.nearby_mines(move))]
+        for cell, count in uncovered:
+            if cell in ai.moves_made:
+                continue
+            before = time.perf_counter()
+            ai.add_knowledge(cell, count)
+            latencies.append(time.perf_counter() - before)
+            knowledge.append(len(ai.sentences))
+    return {
+        "seed": seed,
+        "won": won,
+        "moves": len(latencies),
+        "guesses": guesses,
+        "seconds": time.perf_counter() - start,
+        "latencies": latencies,
+        "knowledge": knowledge
+    }
+
+
+def _play_benchmark_game(args):
+    return play_game(*args)
+
+
+def percentile(values, q):
+    """
+    Returns the `q` quantile (0 to 1) of `values` by nearest rank.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
 
-        if len(relevant_moves) == 0:
-            return None 
 
-        relevant_moves = list(relevant_moves) 
-        idx = random.randint(0, len(relevant_moves) - 1) 
-        return relevant_moves[idx] 
\ No newline at end of file
+def benchmark(filename, games=100, height=16, width=16, mines=40, seed=0,
+              workers=None, guess="probability", know_mines=True, flood=False):
+    """
+    Plays `games` seeded games of the given size on a pool of `workers`
+    processes and writes the win rate, moves per second (of the time
+    spent playing, so it does not depend on `workers`), the p50 and p99
+    latency of `add_knowledge` and the knowledge base size over the
+    course of a game to `filename` as JSON. Game k is seeded from `seed`
+    and k only, so runs of different versions of the AI can be compared.
+    Returns the summary written.
+    """
+    jobs = [
+        (height, width, mines, f"{seed}-{k}", guess, know_mines, flood)
+        for k in range(games)
+    ]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_play_benchmark_game, jobs,
+                                    chunksize=max(1, games // 64)))
+    wall = time.perf_counter() - start
+
+    latencies = [seconds for result in results for seconds in result["latencies"]]
+    moves = sum(result["moves"] for result in results)
+    seconds = sum(result["seconds"] for result in results)
+
+    # mean and largest knowledge base after every `stride` moves, over the
+    # games that lasted that long
+    longest = max((result["moves"] for result in results), default=0)
+    stride = max(1, -(-longest // 50))
+    knowledge = []
+    for move in range(stride, longest + 1, stride):
+        sizes = [
+            result["knowledge"][move - 1] for result in results
+            if result["moves"] >= move
+        ]
+        knowledge.append({
+            "move": move,
+            "games": len(sizes),
+            "mean": sum(sizes) / len(sizes),
+            "max": max(sizes)
+        })
+
+    summary = {
+        "games": games,
+        "height": height,
+        "width": width,
+        "mines": mines,
+        "seed": seed,
+        "guess": guess,
+        "know_mines": know_mines,
+        "flood": flood,
+        "python": platform.python_version(),
+        "win_rate": sum(result["won"] for result in results) / max(games, 1),
+        "moves": moves,
+        "guesses": sum(result["guesses"] for result in results),
+        "seconds": wall,
+        "moves_per_second": moves / seconds if seconds else None,
+        "add_knowledge_p50": percentile(latencies, 0.5),
+        "add_knowledge_p99": percentile(latencies, 0.99),
+        "knowledge": knowledge
+    }
+    with open(filename, "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def main():
+
+    # Parse command-line arguments
+    parser = argparse.ArgumentParser(
+        usage="python minesweeper.py output.json [--games N] [--height H] "
+              "[--width W] [--mines M] [--seed S] [--workers N] [--guess G] "
+              "[--flood] [--min-win-rate R]"
+    )
+    parser.add_argument("output", help="file to write the benchmark to")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--height", type=int, default=16)
+    parser.add_argument("--width", type=int, default=16)
+    parser.add_argument("--mines", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int,
+                        help="number of worker processes")
+    parser.add_argument("--guess", choices=["probability", "random"],
+                        default="probability",
+                        help="how the AI chooses a move when none is safe")
+    parser.add_argument("--unknown-mines", action="store_true",
+                        help="do not tell the AI how many mines there are")
+    parser.add_argument("--flood", action="store_true",
+                        help="uncover whole regions with no nearby mines")
+    parser.add_argument("--min-win-rate", type=float,
+                        help="exit with status 1 if the win rate is lower")
+    args = parser.parse_args()
+
+    summary = benchmark(args.output, args.games, args.height, args.width,
+                        args.mines, args.seed, args.workers, args.guess,
+                        not args.unknown_mines, args.flood)
+
+    # the rates are None when no game got as far as add_knowledge
+    def show(value, scale, spec, unit):
+        return "n/a" if value is None else f"{value * scale:{spec}}{unit}"
+
+    print(f"Won {summary['win_rate']:.1%} of {summary['games']} games, "
+          f"{show(summary['moves_per_second'], 1, '.0f', '')} moves/s, "
+          f"add_knowledge "
+          f"p50 {show(summary['add_knowledge_p50'], 1000, '.3f', 'ms')} "
+          f"p99 {show(summary['add_knowledge_p99'], 1000, '.3f', 'ms')}")
+    if args.min_win_rate is not None and summary["win_rate"] < args.min_win_rate:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()